@@ -0,0 +1,82 @@
+"""
+Measure the bot's import time and the cost of encoding staking calldata.
+
+    python benchmarks/bench_imports.py [--runs 5] [--encodes 10000]
+
+Import times are taken in fresh interpreters: `main` is what has to load before the bot polls, `staking`
+is the web3/safe-eth-py stack it now loads in the background. Encoding compares `staking_calls` with a
+web3 contract's `encodeABI`, which looks the function up in the ABI and normalizes its arguments on
+every call.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+MODULES = ("main", "staking")
+
+STAKING_ADDRESS = "0x545edb750eB8769C868429BE9586F5857A768758"
+VALIDATORS = [f"0x{i:040x}" for i in range(1, 4)]
+AMOUNTS = [10 ** 18] * 3
+# The functions below, as they appear in the staking contract ABI
+ABI = [
+    {"name": "delegate", "type": "function", "stateMutability": "payable", "outputs": [],
+     "inputs": [{"name": "_consensusAddr", "type": "address"}]},
+    {"name": "undelegate", "type": "function", "stateMutability": "nonpayable", "outputs": [],
+     "inputs": [{"name": "_consensusAddr", "type": "address"}, {"name": "_amount", "type": "uint256"}]},
+    {"name": "bulkUndelegate", "type": "function", "stateMutability": "nonpayable", "outputs": [],
+     "inputs": [{"name": "_consensusAddrs", "type": "address[]"}, {"name": "_amounts", "type": "uint256[]"}]},
+]
+
+
+def import_seconds(module: str) -> float:
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True, capture_output=True, text=True)
+    return float(output.stdout)
+
+
+def per_call_us(func, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--encodes", type=int, default=10_000)
+    args = parser.parse_args()
+
+    print(f"import time, median of {args.runs} fresh interpreters")
+    for module in MODULES:
+        samples = [import_seconds(module) for _ in range(args.runs)]
+        print(f"  {module:<10}{statistics.median(samples) * 1000:>10.1f} ms")
+
+    import staking_calls
+    from web3 import Web3
+
+    contract = Web3().eth.contract(address=STAKING_ADDRESS, abi=ABI)
+    cases = {
+        "delegate": (lambda: contract.encodeABI(fn_name="delegate", args=[VALIDATORS[0]]),
+                     lambda: staking_calls.DELEGATE.encode(VALIDATORS[0])),
+        "undelegate": (lambda: contract.encodeABI(fn_name="undelegate", args=[VALIDATORS[0], AMOUNTS[0]]),
+                       lambda: staking_calls.UNDELEGATE.encode(VALIDATORS[0], AMOUNTS[0])),
+        "bulkUndelegate": (lambda: contract.encodeABI(fn_name="bulkUndelegate", args=[VALIDATORS, AMOUNTS]),
+                           lambda: staking_calls.BULK_UNDELEGATE.encode(VALIDATORS, AMOUNTS)),
+    }
+    print(f"encode, mean of {args.encodes} calls")
+    print(f"  {'function':<16}{'encodeABI us':>14}{'staking_calls us':>18}")
+    for name, (web3_encode, precompiled_encode) in cases.items():
+        assert Web3.to_bytes(hexstr=web3_encode()) == precompiled_encode(), name
+        print(f"  {name:<16}{per_call_us(web3_encode, args.encodes):>14.1f}"
+              f"{per_call_us(precompiled_encode, args.encodes):>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
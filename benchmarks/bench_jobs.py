@@ -0,0 +1,158 @@
+"""
+Fire the stake jobs of N chats at once against local stand-ins for the Ronin RPC and the Bot API.
+
+    python benchmarks/bench_jobs.py [--chats 200] [--chats-per-safe 1] [--validators 2] [--prepare]
+                                    [--rpc-latency-ms 50] [--bot-latency-ms 0]
+
+Every chat is configured like `/set_stake_info` and `/setting` would leave it, and all of them are due in
+the same bucket. The run goes through `dispatch_schedule`, so grouping, the worker pools, the batcher and
+the `send_message` replies are all part of it. With `--prepare` the bucket is prepared first, like the
+"prepare" job does ahead of time, and only the dispatch is measured.
+
+A job is one Safe transaction. Its latency runs from the dispatch to the last reply of its group being
+sent. Event-loop blocking adds up the stalls over 10 ms of a 1 ms heartbeat running next to the jobs.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fake_bot_api  # noqa: E402
+import fake_rpc  # noqa: E402
+
+TOKEN = "123:bench"
+NETWORK = "ronin-mainnet"
+HEARTBEAT_SECONDS = 0.001
+# Heartbeat delays below this are timer noise, not blocking
+STALL_SECONDS = 0.01
+
+
+def chat_user_data(chat_id: int, safes: int, validators: int) -> dict:
+    return {
+        "network": NETWORK,
+        "safe-wallet": f"0x{0x5afe0000 + chat_id % safes:040x}",
+        "validators": [f"0x{0xa1000000 + (chat_id + i) % 50:040x}" for i in range(validators)],
+        "staking-amounts": [10 ** 18] * validators,
+        # Custom schedules stake right away, so every chat is due in the current bucket
+        "interval-type": "custom",
+        "interval": 3600,
+        "job-chat-id": chat_id,
+    }
+
+
+async def heartbeat(lags: List[float]) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        lags.append(loop.time() - start - HEARTBEAT_SECONDS)
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+async def run(args: argparse.Namespace) -> None:
+    chain = fake_rpc.FakeChain(args.rpc_latency_ms / 1000)
+    rpc_server = fake_rpc.serve(chain)
+    api = fake_bot_api.FakeBotApi(args.bot_latency_ms / 1000)
+    api_server = fake_bot_api.serve(api)
+    # config reads the environment once, at import
+    os.environ.update(
+        MAINNET_URL=f"http://127.0.0.1:{rpc_server.server_port}/rpc",
+        API_KEY="bench",
+        PRIVATE_KEY="0x" + "11" * 32,
+        TELEGRAM_TOKEN=TOKEN,
+    )
+    os.environ.setdefault("RPC_HEDGE_MS", "0")
+
+    import main as bot
+    from telegram.ext import Application, CallbackContext
+
+    from clients import get_client
+
+    # One line per job would drown the report
+    logging.getLogger().setLevel(logging.WARNING)
+
+    application = Application.builder().token(TOKEN).base_url(
+        f"http://127.0.0.1:{api_server.server_port}/bot").build()
+    await application.initialize()
+    await application.start()
+    # Loaded and connected up front, a restarted bot does this in `post_init` before the first bucket
+    bot.load_chain_stack()
+    get_client(NETWORK)
+
+    now = datetime.now(timezone.utc)
+    safes = max(1, args.chats // args.chats_per_safe)
+    for chat_id in range(1, args.chats + 1):
+        bot.schedule_engine.add(chat_id, chat_id, chat_user_data(chat_id, safes, args.validators), now)
+    groups = bot.group_events(bot.schedule_engine.peek_bucket(now))
+
+    if args.prepare:
+        await asyncio.gather(*(bot.prepare_in_order(safe_groups, groups)
+                               for safe_groups in bot.group_by_safe(groups).values()))
+    chain.reset_counters()
+
+    latencies: List[float] = []
+    done = asyncio.Event()
+    call_staking = bot.call_staking
+
+    async def timed_call_staking(context, group, events):
+        await call_staking(context, group, events)
+        latencies.append(time.perf_counter() - start)
+        if len(latencies) == len(groups):
+            done.set()
+
+    bot.call_staking = timed_call_staking
+    lags: List[float] = []
+    monitor = asyncio.create_task(heartbeat(lags))
+    start = time.perf_counter()
+    await bot.dispatch_schedule(CallbackContext(application))
+    await done.wait()
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+    await application.stop()
+    await application.shutdown()
+
+    failed = sum(1 for _, text in api.messages if text.startswith("Revert"))
+    print(f"{args.chats} chats, {len(groups)} jobs ({args.chats_per_safe} chats per Safe, "
+          f"{args.validators} validators each), prepared: {args.prepare}, "
+          f"rpc latency {args.rpc_latency_ms:g} ms")
+    print(f"  jobs/s            {len(groups) / elapsed:>10.1f}")
+    print(f"  latency p50 ms    {percentile(latencies, 50) * 1000:>10.1f}")
+    print(f"  latency p90 ms    {percentile(latencies, 90) * 1000:>10.1f}")
+    print(f"  latency p99 ms    {percentile(latencies, 99) * 1000:>10.1f}")
+    print(f"  latency max ms    {max(latencies) * 1000:>10.1f}")
+    print(f"  rpc calls/job     {sum(chain.calls.values()) / len(groups):>10.2f}")
+    print(f"  http posts/job    {chain.http_requests / len(groups):>10.2f}")
+    stalls = [lag for lag in lags if lag > STALL_SECONDS]
+    print(f"  loop blocked ms   {sum(stalls) * 1000:>10.1f}  ({len(stalls)} stalls, max "
+          f"{max(lags, default=0) * 1000:.1f} ms, heartbeat median {statistics.median(lags or [0]) * 1000:.2f} ms)")
+    print(f"  failed replies    {failed:>10}")
+    for method, count in chain.calls.most_common():
+        print(f"    {method:<28}{count / len(groups):>8.2f} per job")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--chats-per-safe", type=int, default=1)
+    parser.add_argument("--validators", type=int, default=2)
+    parser.add_argument("--prepare", action="store_true")
+    parser.add_argument("--rpc-latency-ms", type=float, default=50)
+    parser.add_argument("--bot-latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
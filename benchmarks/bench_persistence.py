@@ -0,0 +1,125 @@
+"""
+Compare SQLitePersistence with PicklePersistence at N users.
+
+    python benchmarks/bench_persistence.py [--users 10000] [--touched 100]
+
+Every backend runs in its own process so resident memory numbers do not leak between them. For each one we
+measure the startup load, the resident memory it adds and one `update_persistence` run that writes the
+`--touched` users changed since the last run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from telegram.ext import ExtBot, PicklePersistence  # noqa: E402
+
+from persistence import SQLitePersistence  # noqa: E402
+
+BACKENDS = ("pickle", "pickle-on-flush", "sqlite")
+
+
+def user_data(user_id: int) -> dict:
+    return {
+        "network": "ronin-mainnet",
+        "safe-wallet": f"0x{user_id:040x}",
+        "validators": [f"0x{user_id + i:040x}" for i in range(3)],
+        "staking-amounts": [10 ** 18] * 3,
+        "interval-type": "daily",
+        "stake-time": "11:00",
+        "unstake-time": "22:00",
+    }
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def make_persistence(backend: str, path: str):
+    if backend == "sqlite":
+        return SQLitePersistence(filepath=path)
+    persistence = PicklePersistence(filepath=path, on_flush=backend == "pickle-on-flush")
+    persistence.set_bot(ExtBot("123:bench"))
+    return persistence
+
+
+async def seed(backend: str, path: str, users: int) -> None:
+    persistence = make_persistence(backend, path)
+    await persistence.get_user_data()
+    if backend == "sqlite":
+        await asyncio.gather(*(persistence.update_user_data(i, user_data(i)) for i in range(users)))
+    else:
+        # Fill the in-memory copy directly, going through update_user_data would rewrite the file N times
+        persistence.user_data.update({i: user_data(i) for i in range(users)})
+        persistence._dump_singlefile()
+    await persistence.flush()
+
+
+async def measure(backend: str, path: str, touched: int) -> dict:
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    persistence = make_persistence(backend, path)
+    # What Application.initialize keeps: the data it loaded, plus whatever the persistence holds on to
+    loaded = await persistence.get_user_data()
+    await persistence.get_conversations("stake-info")
+    load_seconds = time.perf_counter() - start
+    rss_after = rss_bytes()
+
+    start = time.perf_counter()
+    updates = []
+    for user_id in range(touched):
+        loaded[user_id]["stake-time"] = "12:00"
+        updates.append(persistence.update_user_data(user_id, loaded[user_id]))
+    await asyncio.gather(*updates)
+    await asyncio.sleep(0)
+    if backend == "pickle-on-flush":
+        await persistence.flush()
+    flush_seconds = time.perf_counter() - start
+    return {
+        "load_ms": load_seconds * 1000,
+        "flush_ms": flush_seconds * 1000,
+        "rss_mb": (rss_after - rss_before) / 2 ** 20,
+        "file_mb": os.path.getsize(path) / 2 ** 20,
+    }
+
+
+def run_backend(backend: str, users: int, touched: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench")
+        asyncio.run(seed(backend, path, users))
+        return asyncio.run(measure(backend, path, touched))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--touched", type=int, default=100)
+    parser.add_argument("--backend", choices=BACKENDS)
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args.backend, args.users, args.touched)))
+        return
+
+    print(f"{args.users} users, {args.touched} touched per update_persistence run")
+    print(f"{'backend':<18}{'load ms':>10}{'flush ms':>10}{'rss MB':>10}{'file MB':>10}")
+    for backend in BACKENDS:
+        output = subprocess.run(
+            [sys.executable, __file__, "--backend", backend, "--users", str(args.users),
+             "--touched", str(args.touched)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output)
+        print(f"{backend:<18}{result['load_ms']:>10.1f}{result['flush_ms']:>10.1f}"
+              f"{result['rss_mb']:>10.1f}{result['file_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
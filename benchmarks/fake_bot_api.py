@@ -0,0 +1,91 @@
+"""
+Local stand-in for the Telegram Bot API, enough for `Application.initialize` and `send_message`.
+
+    python benchmarks/fake_bot_api.py [--port 8081] [--latency-ms 0]
+
+Point the bot at it with `Application.builder().base_url("http://127.0.0.1:<port>/bot")`. `getUpdates`
+long-polls for a second and returns nothing, every other method just succeeds.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qsl
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+class FakeBotApi:
+    """Messages sent through the fake API, shared by the server threads."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.messages: List[Tuple[int, str]] = []
+        self._message_id = 0
+
+    def answer(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            time.sleep(1)
+            return []
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            with self.lock:
+                self._message_id += 1
+                self.messages.append((chat_id, params.get("text", "")))
+                message_id = self._message_id
+            return {"message_id": message_id, "date": int(time.time()), "text": params.get("text", ""),
+                    "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+        return True
+
+
+def _params(content_type: str, body: bytes) -> Dict[str, Any]:
+    if content_type.startswith("application/json"):
+        return json.loads(body or b"{}")
+    return dict(parse_qsl(body.decode()))
+
+
+def serve(api: FakeBotApi, port: int = 0) -> ThreadingHTTPServer:
+    """Serve `api` on 127.0.0.1 from a daemon thread, port 0 picks a free one."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            method = self.path.rsplit("/", 1)[-1]
+            if api.latency:
+                time.sleep(api.latency)
+            result = api.answer(method, _params(self.headers.get("Content-Type", ""), body))
+            data = json.dumps({"ok": True, "result": result}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    server = serve(FakeBotApi(args.latency_ms / 1000), args.port)
+    print(f"Fake Bot API on http://127.0.0.1:{server.server_port}/bot")
+    threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
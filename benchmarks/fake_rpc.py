@@ -0,0 +1,154 @@
+"""
+Local JSON-RPC server answering the calls the staking, receipt and /status paths make.
+
+    python benchmarks/fake_rpc.py [--port 8545] [--latency-ms 0]
+
+Every Safe is at nonce 0 with threshold 1, simulations succeed and every sent tx gets a successful receipt
+right away. Nothing is executed, the point is to measure the bot, not the chain.
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict
+
+from eth_abi import decode, encode
+from eth_utils import function_signature_to_4byte_selector, keccak
+
+CHAIN_ID = 2020
+BLOCK_NUMBER = 1_000_000
+
+
+def _selector(signature: str) -> str:
+    return "0x" + function_signature_to_4byte_selector(signature).hex()
+
+
+def _word(types, values) -> str:
+    return "0x" + encode(types, values).hex()
+
+
+SAFE_NONCE = _selector("nonce()")
+SAFE_VERSION = _selector("VERSION()")
+SAFE_THRESHOLD = _selector("getThreshold()")
+SAFE_REQUIRED_TX_GAS = _selector("requiredTxGas(address,uint256,bytes,uint8)")
+SAFE_EXEC_TRANSACTION = _selector(
+    "execTransaction(address,uint256,bytes,uint8,uint256,uint256,uint256,address,address,bytes)")
+# Argument types of the staking views, each returns one amount per pool of its last argument
+STAKING_VIEWS = {
+    _selector("getManyStakingAmounts(address[],address[])"): ["address[]", "address[]"],
+    _selector("getManyStakingTotals(address[])"): ["address[]"],
+    _selector("getRewards(address,address[])"): ["address", "address[]"],
+}
+
+
+class FakeChain:
+    """State and counters shared by the server threads."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls: Counter = Counter()
+        self.http_requests = 0
+        self.sent = 0
+
+    def reset_counters(self) -> None:
+        with self.lock:
+            self.calls.clear()
+            self.http_requests = 0
+
+    def answer(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        method, params = request["method"], request.get("params", [])
+        with self.lock:
+            self.calls[method] += 1
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        if method == "eth_call":
+            data = params[0].get("data") or params[0].get("input", "")
+            selector = data[:10]
+            if selector == SAFE_REQUIRED_TX_GAS:
+                # The Safe reverts with the estimation, abi-encoded like a revert string
+                revert = "0x08c379a0" + encode(["bytes"], [(50_000).to_bytes(32, "big")]).hex()
+                response["error"] = {"code": 3, "message": "execution reverted", "data": revert}
+                return response
+            if selector == SAFE_NONCE:
+                result = _word(["uint256"], [0])
+            elif selector == SAFE_VERSION:
+                result = _word(["string"], ["1.3.0"])
+            elif selector == SAFE_THRESHOLD:
+                result = _word(["uint256"], [1])
+            elif selector == SAFE_EXEC_TRANSACTION:
+                result = _word(["bool"], [True])
+            elif selector in STAKING_VIEWS:
+                pools = decode(STAKING_VIEWS[selector], bytes.fromhex(data[10:]))[-1]
+                result = _word(["uint256[]"], [[10 ** 18] * len(pools)])
+            else:
+                result = _word(["uint256"], [0])
+        elif method == "eth_chainId":
+            result = hex(CHAIN_ID)
+        elif method == "eth_blockNumber":
+            result = hex(BLOCK_NUMBER)
+        elif method == "eth_getBalance":
+            result = hex(10 ** 21)
+        elif method == "eth_estimateGas":
+            result = hex(100_000)
+        elif method == "eth_gasPrice":
+            result = hex(20 * 10 ** 9)
+        elif method == "eth_getTransactionCount":
+            with self.lock:
+                result = hex(self.sent)
+        elif method == "eth_sendRawTransaction":
+            with self.lock:
+                self.sent += 1
+            result = "0x" + keccak(hexstr=params[0]).hex()
+        elif method == "eth_getTransactionReceipt":
+            result = {"transactionHash": params[0], "status": "0x1", "blockNumber": hex(BLOCK_NUMBER),
+                      "gasUsed": hex(90_000), "logs": []}
+        else:
+            result = None
+        response["result"] = result
+        return response
+
+
+def serve(chain: FakeChain, port: int = 0) -> ThreadingHTTPServer:
+    """Serve `chain` on 127.0.0.1 from a daemon thread, port 0 picks a free one."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with chain.lock:
+                chain.http_requests += 1
+            if chain.latency:
+                time.sleep(chain.latency)
+            if isinstance(body, list):
+                output = [chain.answer(request) for request in body]
+            else:
+                output = chain.answer(body)
+            data = json.dumps(output).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+    server = serve(FakeChain(args.latency_ms / 1000), args.port)
+    print(f"Fake JSON-RPC on http://127.0.0.1:{server.server_port}")
+    threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
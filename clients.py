@@ -0,0 +1,78 @@
+import logging
+import threading
+from typing import Dict
+
+from cachetools import LRUCache
+from gnosis.eth import EthereumClient
+from gnosis.eth.contracts import get_safe_V1_3_0_contract
+from gnosis.safe import Safe
+from web3 import Web3
+from web3.contract import Contract
+from web3.middleware import geth_poa_middleware
+
+from config import (
+    RPC_BACKOFF,
+    RPC_BATCH_WINDOW,
+    RPC_HEDGE_DELAY,
+    RPC_RETRIES,
+    RPC_TIMEOUT_SECONDS,
+    SAFE_CACHE_SIZE,
+    get_multisend_address,
+    get_rpc_urls,
+    get_staking_address,
+)
+from rpc_batch import RpcBatcher
+from rpc_router import RouterProvider, RpcRouter
+
+logger = logging.getLogger(__name__)
+
+
+class ChainClient:
+    """Long-lived web3 stack for one network, shared by every staking job."""
+
+    def __init__(self, network: str):
+        self.network = network
+        self.rpc_urls = get_rpc_urls(network)
+        self.staking_address = get_staking_address(network)
+        self.multisend_address = get_multisend_address(network)
+        self.router = RpcRouter(self.rpc_urls, timeout=RPC_TIMEOUT_SECONDS, hedge_delay=RPC_HEDGE_DELAY,
+                                retries=RPC_RETRIES, backoff=RPC_BACKOFF)
+        self.ethereum_client = EthereumClient(self.rpc_urls[0])
+        # Every web3 call, including the broadcast in `SafeTx.execute`, goes through the router
+        self.ethereum_client.w3.provider = RouterProvider(self.router)
+        self.ethereum_client.slow_w3.provider = RouterProvider(self.router)
+        self.w3: Web3 = self.ethereum_client.w3
+        if geth_poa_middleware not in self.w3.middleware_onion:
+            self.w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        # `get_chain_id` is cached, SafeTx hashing reads it from there and `staking._send` passes it to the tx
+        self.chain_id = self.ethereum_client.get_chain_id()
+        # Unbound contract, only used to encode calldata
+        self.safe_contract: Contract = get_safe_V1_3_0_contract(self.w3)
+        self.batcher = RpcBatcher(self.router, RPC_BATCH_WINDOW)
+        self._safes: LRUCache = LRUCache(maxsize=SAFE_CACHE_SIZE)
+        self._safes_lock = threading.Lock()
+
+    def get_safe(self, safe_address: str) -> Safe:
+        """Return a cached Safe handle, so its contract/version lookup only happens once per address."""
+        safe_address = Web3.to_checksum_address(safe_address)
+        with self._safes_lock:
+            safe = self._safes.get(safe_address)
+            if safe is None:
+                safe = Safe(safe_address, self.ethereum_client)
+                self._safes[safe_address] = safe
+            return safe
+
+
+_clients: Dict[str, ChainClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(network: str) -> ChainClient:
+    """Return the client for `network`, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(network)
+        if client is None:
+            logger.info("Creating chain client for %s", network)
+            client = ChainClient(network)
+            _clients[network] = client
+        return client
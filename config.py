@@ -0,0 +1,100 @@
+import os
+from typing import List
+
+from dotenv import load_dotenv
+
+# Load env
+load_dotenv()
+api_key = os.getenv("API_KEY")
+
+private_key = os.getenv("PRIVATE_KEY")
+telegram_token = os.getenv("TELEGRAM_TOKEN")
+mainnet_rpc_url = os.getenv("MAINNET_URL")
+testnet_rpc_url = os.getenv("TESTNET_URL")
+# Comma separated endpoints, used as given, that share the load with the main one and take over when it fails
+mainnet_fallback_urls = os.getenv("MAINNET_FALLBACK_URLS", "")
+testnet_fallback_urls = os.getenv("TESTNET_FALLBACK_URLS", "")
+
+EXPLORER_HOST_MAINNET = "https://app.roninchain.com"
+EXPLORER_HOST_TESTNET = "https://saigon-app.roninchain.com"
+STAKING_PROXY_MAINNET = "0x545edb750eB8769C868429BE9586F5857A768758"  # mainnet
+STAKING_PROXY_TESTNET = "0x9C245671791834daf3885533D24dce516B763B28"  # testnet
+# MultiSendCallOnly v1.3.0, override if the Safe deployment on the network uses another address
+MULTISEND_MAINNET = os.getenv("MULTISEND_MAINNET", "0x40A2aCCbd92BCA938b02010E17A5b8929b49130D")
+MULTISEND_TESTNET = os.getenv("MULTISEND_TESTNET", "0x40A2aCCbd92BCA938b02010E17A5b8929b49130D")
+
+OPERATION_CALL = 0
+OPERATION_DELEGATE_CALL = 1
+
+# Bot state, migrated once from the older `PicklePersistence` file when the database does not exist yet
+PERSISTENCE_PATH = os.getenv("PERSISTENCE_PATH", "gnosis.sqlite3")
+LEGACY_PICKLE_PATH = "gnosis"
+
+# Stake/unstake events are grouped into buckets of this many seconds, drained by a single job
+SCHEDULE_BUCKET_SECONDS = int(os.getenv("SCHEDULE_BUCKET_SECONDS", 60))
+# Safe txs of a bucket are built, signed and simulated this long before it is due, 0 disables it
+PREPARE_LEAD_SECONDS = int(os.getenv("PREPARE_LEAD_SECONDS", 20))
+
+# Pending tx receipts are polled about once per Ronin block, txs without receipt after the timeout are dropped
+RECEIPT_POLL_SECONDS = float(os.getenv("RECEIPT_POLL_SECONDS", 3))
+RECEIPT_TIMEOUT_SECONDS = int(os.getenv("RECEIPT_TIMEOUT_SECONDS", 600))
+
+# /status results and the head block they were read at are reused for this long, about one Ronin block
+STATUS_CACHE_SECONDS = float(os.getenv("STATUS_CACHE_SECONDS", 3))
+# Poll the head block this often and drop /status results of older blocks as soon as it moves, 0 disables it
+STATUS_BLOCK_POLL_SECONDS = float(os.getenv("STATUS_BLOCK_POLL_SECONDS", 0))
+
+# Prometheus metrics are served on http://METRICS_ADDRESS:METRICS_PORT/metrics, 0 disables it
+METRICS_ADDRESS = os.getenv("METRICS_ADDRESS", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# When set, every staking job appends its phase timings to this file as one JSON line
+METRICS_TRACE_PATH = os.getenv("METRICS_TRACE_PATH")
+
+SAFE_CACHE_SIZE = int(os.getenv("SAFE_CACHE_SIZE", 256))
+# Max staking jobs talking to the same network at once
+STAKING_CONCURRENCY_MAINNET = int(os.getenv("STAKING_CONCURRENCY_MAINNET", 8))
+STAKING_CONCURRENCY_TESTNET = int(os.getenv("STAKING_CONCURRENCY_TESTNET", 4))
+# How long the first read of a tick waits for other jobs' reads to join its JSON-RPC batch
+RPC_BATCH_WINDOW = int(os.getenv("RPC_BATCH_WINDOW_MS", 25)) / 1000
+RPC_TIMEOUT_SECONDS = int(os.getenv("RPC_TIMEOUT_SECONDS", 15))
+# A read still unanswered after this long is also sent to the next best endpoint, 0 disables it
+RPC_HEDGE_DELAY = int(os.getenv("RPC_HEDGE_MS", 500)) / 1000
+# Extra attempts for reads that failed on every endpoint tried, waiting RPC_BACKOFF_MS doubled each time
+RPC_RETRIES = int(os.getenv("RPC_RETRIES", 2))
+RPC_BACKOFF = int(os.getenv("RPC_BACKOFF_MS", 200)) / 1000
+
+
+def get_rpc_url(network: str) -> str:
+    if network == "ronin-testnet":
+        return f"{testnet_rpc_url}?apikey={api_key}"
+    else:
+        return f"{mainnet_rpc_url}?apikey={api_key}"
+
+
+def get_rpc_urls(network: str) -> List[str]:
+    if network == "ronin-testnet":
+        fallback_urls = testnet_fallback_urls
+    else:
+        fallback_urls = mainnet_fallback_urls
+    return [get_rpc_url(network)] + [url.strip() for url in fallback_urls.split(",") if url.strip()]
+
+
+def get_staking_address(network: str) -> str:
+    if network == "ronin-testnet":
+        return STAKING_PROXY_TESTNET
+    else:
+        return STAKING_PROXY_MAINNET
+
+
+def get_multisend_address(network: str) -> str:
+    if network == "ronin-testnet":
+        return MULTISEND_TESTNET
+    else:
+        return MULTISEND_MAINNET
+
+
+def get_staking_concurrency(network: str) -> int:
+    if network == "ronin-testnet":
+        return STAKING_CONCURRENCY_TESTNET
+    else:
+        return STAKING_CONCURRENCY_MAINNET
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, TypeVar
+
+from config import get_staking_concurrency
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def get_pool(network: str) -> ThreadPoolExecutor:
+    """Return the bounded worker pool for `network`, creating it on first use."""
+    with _lock:
+        pool = _pools.get(network)
+        if pool is None:
+            max_workers = get_staking_concurrency(network)
+            logger.info("Creating %s staking workers for %s", max_workers, network)
+            pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"staking-{network}")
+            _pools[network] = pool
+        return pool
+
+
+async def run_blocking(network: str, func: Callable[..., T], *args) -> T:
+    """Run blocking web3 work on the network's pool so the event loop keeps serving updates."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(network), partial(func, *args))
+
+
+def shutdown() -> None:
+    """Stop every worker pool, dropping jobs that have not started yet."""
+    with _lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
@@ -1,49 +1,67 @@
-from web3 import Web3
-from datetime import datetime
-from dotenv import load_dotenv
-from typing import Dict
+import asyncio
+import importlib
 import os
-from web3.middleware import geth_poa_middleware
-from gnosis.eth import EthereumClient
-from gnosis.safe import Safe
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import ThreadingHTTPServer
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 import logging
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import (
     Application,
     CommandHandler,
     ContextTypes,
-    PicklePersistence,
     ConversationHandler,
     MessageHandler,
     filters
 )
 
+import executor
+from config import (
+    EXPLORER_HOST_MAINNET,
+    EXPLORER_HOST_TESTNET,
+    LEGACY_PICKLE_PATH,
+    METRICS_ADDRESS,
+    METRICS_PORT,
+    METRICS_TRACE_PATH,
+    PERSISTENCE_PATH,
+    PREPARE_LEAD_SECONDS,
+    RECEIPT_POLL_SECONDS,
+    SCHEDULE_BUCKET_SECONDS,
+    STATUS_BLOCK_POLL_SECONDS,
+    STATUS_CACHE_SECONDS,
+    telegram_token,
+)
+from executor import run_blocking
+from metrics import (
+    SCHEDULE_LAG_SECONDS,
+    STAKING_JOB_SECONDS,
+    STAKING_JOBS,
+    STAKING_RECEIPTS,
+    JobTrace,
+    handler_metrics,
+    start_server,
+    traced,
+)
+from persistence import SQLitePersistence, migrate_pickle
+from receipts import ReceiptTracker, fetch_receipts
+from scheduler import STAKE, DueEvent, EventGroup, ScheduleEngine, group_by_safe, group_events
+from status import StakingStatus, StatusCache, fetch_block_number, fetch_status
+
+if TYPE_CHECKING:
+    from staking import Delegations
+
 # Enable logging
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO
 )
 logging.getLogger("httpx").setLevel(logging.WARNING)
+# Its retry warnings print the RPC request URL, API key included, the router logs the failure itself
+logging.getLogger("urllib3.connectionpool").setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
-# Load env
-load_dotenv()
-api_key = os.getenv("API_KEY")
-
-private_key = os.getenv("PRIVATE_KEY")
-telegram_token = os.getenv("TELEGRAM_TOKEN")
-mainnet_rpc_url = os.getenv("MAINNET_URL")
-testnet_rpc_url = os.getenv("TESTNET_URL")
-
-EXPLORER_HOST_MAINNET = "https://app.roninchain.com"
-EXPLORER_HOST_TESTNET = "https://saigon-app.roninchain.com"
-STAKING_PROXY_MAINNET = "0x545edb750eB8769C868429BE9586F5857A768758"  # mainnet
-STAKING_PROXY_TESTNET = "0x9C245671791834daf3885533D24dce516B763B28"  # testnet
-
-STAKING_ABI = '[{"inputs":[],"stateMutability":"nonpayable","type":"constructor"},{"inputs":[{"internalType":"address","name":"admin","type":"address"}],"name":"ErrAdminOfAnyActivePoolForbidden","type":"error"},{"inputs":[{"internalType":"address","name":"addr","type":"address"},{"internalType":"string","name":"extraInfo","type":"string"}],"name":"ErrCannotInitTransferRON","type":"error"},{"inputs":[],"name":"ErrCannotTransferRON","type":"error"},{"inputs":[{"internalType":"enum ContractType","name":"contractType","type":"uint8"}],"name":"ErrContractTypeNotFound","type":"error"},{"inputs":[{"internalType":"bytes4","name":"msgSig","type":"bytes4"}],"name":"ErrDuplicated","type":"error"},{"inputs":[{"internalType":"address","name":"poolAddr","type":"address"}],"name":"ErrInactivePool","type":"error"},{"inputs":[{"internalType":"bytes4","name":"msgSig","type":"bytes4"},{"internalType":"uint256","name":"currentBalance","type":"uint256"},{"internalType":"uint256","name":"sendAmount","type":"uint256"}],"name":"ErrInsufficientBalance","type":"error"},{"inputs":[],"name":"ErrInsufficientDelegatingAmount","type":"error"},{"inputs":[],"name":"ErrInsufficientStakingAmount","type":"error"},{"inputs":[],"name":"ErrInvalidArrays","type":"error"},{"inputs":[],"name":"ErrInvalidCommissionRate","type":"error"},{"inputs":[],"name":"ErrInvalidPoolShare","type":"error"},{"inputs":[],"name":"ErrOnlyPoolAdminAllowed","type":"error"},{"inputs":[],"name":"ErrPoolAdminForbidden","type":"error"},{"inputs":[{"internalType":"bytes4","name":"msgSig","type":"bytes4"}],"name":"ErrRecipientRevert","type":"error"},{"inputs":[],"name":"ErrStakingAmountLeft","type":"error"},{"inputs":[],"name":"ErrThreeInteractionAddrsNotEqual","type":"error"},{"inputs":[{"internalType":"bytes4","name":"msgSig","type":"bytes4"},{"internalType":"enum RoleAccess","name":"expectedRole","type":"uint8"}],"name":"ErrUnauthorized","type":"error"},{"inputs":[],"name":"ErrUndelegateTooEarly","type":"error"},{"inputs":[],"name":"ErrUndelegateZeroAmount","type":"error"},{"inputs":[{"internalType":"bytes4","name":"msgSig","type":"bytes4"},{"internalType":"enum ContractType","name":"expectedContractType","type":"uint8"},{"internalType":"address","name":"actual","type":"address"}],"name":"ErrUnexpectedInternalCall","type":"error"},{"inputs":[],"name":"ErrUnstakeTooEarly","type":"error"},{"inputs":[],"name":"ErrUnstakeZeroAmount","type":"error"},{"inputs":[{"internalType":"address","name":"addr","type":"address"}],"name":"ErrZeroCodeContract","type":"error"},{"inputs":[],"name":"ErrZeroValue","type":"error"},{"anonymous":false,"inputs":[{"indexed":false,"internalType":"uint256","name":"minRate","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"maxRate","type":"uint256"}],"name":"CommissionRateRangeUpdated","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"enum ContractType","name":"contractType","type":"uint8"},{"indexed":true,"internalType":"address","name":"addr","type":"address"}],"name":"ContractUpdated","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"internalType":"uint256","name":"minSecs","type":"uint256"}],"name":"CooldownSecsToUndelegateUpdated","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"delegator","type":"address"},{"indexed":true,"internalType":"address","name":"consensuAddr","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount","type":"uint256"}],"name":"Delegated","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"internalType":"uint8","name":"version","type":"uint8"}],"name":"Initialized","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"internalType":"uint256","name":"threshold","type":"uint256"}],"name":"MinValidatorStakingAmountUpdated","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"validator","type":"address"},{"indexed":true,"internalType":"address","name":"admin","type":"address"}],"name":"PoolApproved","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"uint256","name":"period","type":"uint256"},{"indexed":true,"internalType":"address","name":"poolAddr","type":"address"},{"indexed":false,"internalType":"uint256","name":"shares","type":"uint256"}],"name":"PoolSharesUpdated","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"internalType":"address[]","name":"validator","type":"address[]"}],"name":"PoolsDeprecated","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"uint256","name":"period","type":"uint256"},{"indexed":false,"internalType":"address[]","name":"poolAddrs","type":"address[]"}],"name":"PoolsUpdateConflicted","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"uint256","name":"period","type":"uint256"},{"indexed":false,"internalType":"address[]","name":"poolAddrs","type":"address[]"},{"indexed":false,"internalType":"uint256[]","name":"rewards","type":"uint256[]"}],"name":"PoolsUpdateFailed","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"uint256","name":"period","type":"uint256"},{"indexed":false,"internalType":"address[]","name":"poolAddrs","type":"address[]"},{"indexed":false,"internalType":"uint256[]","name":"aRps","type":"uint256[]"},{"indexed":false,"internalType":"uint256[]","name":"shares","type":"uint256[]"}],"name":"PoolsUpdated","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"poolAddr","type":"address"},{"indexed":true,"internalType":"address","name":"user","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount","type":"uint256"}],"name":"RewardClaimed","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"consensuAddr","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount","type":"uint256"}],"name":"Staked","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"validator","type":"address"},{"indexed":true,"internalType":"address","name":"recipient","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"contractBalance","type":"uint256"}],"name":"StakingAmountDeductFailed","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"validator","type":"address"},{"indexed":true,"internalType":"address","name":"admin","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"contractBalance","type":"uint256"}],"name":"StakingAmountTransferFailed","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"delegator","type":"address"},{"indexed":true,"internalType":"address","name":"consensuAddr","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount","type":"uint256"}],"name":"Undelegated","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"consensuAddr","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount","type":"uint256"}],"name":"Unstaked","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"poolAddr","type":"address"},{"indexed":true,"internalType":"address","name":"user","type":"address"},{"indexed":false,"internalType":"uint256","name":"debited","type":"uint256"}],"name":"UserRewardUpdated","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"internalType":"uint256","name":"secs","type":"uint256"}],"name":"WaitingSecsToRevokeUpdated","type":"event"},{"stateMutability":"payable","type":"fallback"},{"inputs":[],"name":"DEFAULT_ADDITION_GAS","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"PERIOD_DURATION","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"_candidateAdmin","type":"address"},{"internalType":"address","name":"_consensusAddr","type":"address"},{"internalType":"address payable","name":"_treasuryAddr","type":"address"},{"internalType":"uint256","name":"_commissionRate","type":"uint256"}],"name":"applyValidatorCandidate","outputs":[],"stateMutability":"payable","type":"function"},{"inputs":[{"internalType":"address[]","name":"_consensusAddrs","type":"address[]"},{"internalType":"uint256[]","name":"_amounts","type":"uint256[]"}],"name":"bulkUndelegate","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address[]","name":"_consensusAddrList","type":"address[]"}],"name":"claimRewards","outputs":[{"internalType":"uint256","name":"_amount","type":"uint256"}],"stateMutability":"nonpayable","type":"function"},{"inputs":[],"name":"cooldownSecsToUndelegate","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"_consensusAddr","type":"address"}],"name":"delegate","outputs":[],"stateMutability":"payable","type":"function"},{"inputs":[{"internalType":"address[]","name":"_consensusAddrList","type":"address[]"},{"internalType":"address","name":"_consensusAddrDst","type":"address"}],"name":"delegateRewards","outputs":[{"internalType":"uint256","name":"_amount","type":"uint256"}],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_consensusAddr","type":"address"},{"internalType":"uint256","name":"_amount","type":"uint256"}],"name":"execDeductStakingAmount","outputs":[{"internalType":"uint256","name":"_actualDeductingAmount","type":"uint256"}],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address[]","name":"_pools","type":"address[]"},{"internalType":"uint256","name":"_newPeriod","type":"uint256"}],"name":"execDeprecatePools","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address[]","name":"_consensusAddrs","type":"address[]"},{"internalType":"uint256[]","name":"_rewards","type":"uint256[]"},{"internalType":"uint256","name":"_period","type":"uint256"}],"name":"execRecordRewards","outputs":[],"stateMutability":"payable","type":"function"},{"inputs":[],"name":"getCommissionRateRange","outputs":[{"internalType":"uint256","name":"","type":"uint256"},{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"enum ContractType","name":"contractType","type":"uint8"}],"name":"getContract","outputs":[{"internalType":"address","name":"contract_","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address[]","name":"_pools","type":"address[]"}],"name":"getManySelfStakings","outputs":[{"internalType":"uint256[]","name":"_selfStakings","type":"uint256[]"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address[]","name":"_poolAddrs","type":"address[]"},{"internalType":"address[]","name":"_userList","type":"address[]"}],"name":"getManyStakingAmounts","outputs":[{"internalType":"uint256[]","name":"_stakingAmounts","type":"uint256[]"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address[]","name":"_poolList","type":"address[]"}],"name":"getManyStakingTotals","outputs":[{"internalType":"uint256[]","name":"_stakingAmounts","type":"uint256[]"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"_poolAdminAddr","type":"address"}],"name":"getPoolAddressOf","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"_poolAddr","type":"address"}],"name":"getPoolDetail","outputs":[{"internalType":"address","name":"_admin","type":"address"},{"internalType":"uint256","name":"_stakingAmount","type":"uint256"},{"internalType":"uint256","name":"_stakingTotal","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"_poolAddr","type":"address"},{"internalType":"address","name":"_user","type":"address"}],"name":"getReward","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"_user","type":"address"},{"internalType":"address[]","name":"_poolAddrList","type":"address[]"}],"name":"getRewards","outputs":[{"internalType":"uint256[]","name":"_rewards","type":"uint256[]"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"_poolAddr","type":"address"},{"internalType":"address","name":"_user","type":"address"}],"name":"getStakingAmount","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"_poolAddr","type":"address"}],"name":"getStakingTotal","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"__validatorContract","type":"address"},{"internalType":"uint256","name":"__minValidatorStakingAmount","type":"uint256"},{"internalType":"uint256","name":"__maxCommissionRate","type":"uint256"},{"internalType":"uint256","name":"__cooldownSecsToUndelegate","type":"uint256"},{"internalType":"uint256","name":"__waitingSecsToRevoke","type":"uint256"}],"name":"initialize","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[],"name":"initializeV2","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_poolAdminAddr","type":"address"}],"name":"isAdminOfActivePool","outputs":[{"internalType":"bool","name":"","type":"bool"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"minValidatorStakingAmount","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"_consensusAddrSrc","type":"address"},{"internalType":"address","name":"_consensusAddrDst","type":"address"},{"internalType":"uint256","name":"_amount","type":"uint256"}],"name":"redelegate","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_consensusAddr","type":"address"}],"name":"requestEmergencyExit","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_consensusAddr","type":"address"}],"name":"requestRenounce","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_consensusAddr","type":"address"},{"internalType":"uint256","name":"_effectiveDaysOnwards","type":"uint256"},{"internalType":"uint256","name":"_commissionRate","type":"uint256"}],"name":"requestUpdateCommissionRate","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"uint256","name":"_minRate","type":"uint256"},{"internalType":"uint256","name":"_maxRate","type":"uint256"}],"name":"setCommissionRateRange","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"enum ContractType","name":"contractType","type":"uint8"},{"internalType":"address","name":"addr","type":"address"}],"name":"setContract","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"uint256","name":"_cooldownSecs","type":"uint256"}],"name":"setCooldownSecsToUndelegate","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"uint256","name":"_threshold","type":"uint256"}],"name":"setMinValidatorStakingAmount","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"uint256","name":"_secs","type":"uint256"}],"name":"setWaitingSecsToRevoke","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_consensusAddr","type":"address"}],"name":"stake","outputs":[],"stateMutability":"payable","type":"function"},{"inputs":[{"internalType":"address","name":"_candidateAdmin","type":"address"},{"internalType":"address","name":"_consensusAddr","type":"address"},{"internalType":"address payable","name":"_treasuryAddr","type":"address"},{"internalType":"uint256","name":"_commissionRate","type":"uint256"}],"name":"tmp_re_applyValidatorCandidate","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_consensusAddr","type":"address"},{"internalType":"uint256","name":"_amount","type":"uint256"}],"name":"undelegate","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_consensusAddr","type":"address"},{"internalType":"uint256","name":"_amount","type":"uint256"}],"name":"unstake","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[],"name":"waitingSecsToRevoke","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"stateMutability":"payable","type":"receive"}]'
-OPERATION_CALL = 0
-OPERATION_DELEGATE_CALL = 1
-
-
 
 # state definitions
 SELECTING_NETWORK, ENTER_SAFE_WALLET, ENTER_VALIDATOR, ENTER_STAKING_AMOUNT = map(chr, range(4))
@@ -51,6 +69,14 @@ ENTER_STAKE_TIME, ENTER_UNSTAKE_TIME, SELECTING_INTERVAL_TYPE, ENTER_INTERVAL =
 
 END = ConversationHandler.END
 
+schedule_engine = ScheduleEngine(SCHEDULE_BUCKET_SECONDS)
+receipt_tracker = ReceiptTracker()
+status_cache = StatusCache(STATUS_CACHE_SECONDS)
+metrics_server: Optional[ThreadingHTTPServer] = None
+
+# Validators and amounts can be entered separated by commas, spaces or new lines
+LIST_SEPARATOR = re.compile(r"[\s,]+")
+
 
 def facts_to_str(user_data: Dict[str, str]) -> str:
     """Helper function for formatting the gathered user info."""
@@ -58,28 +84,29 @@ def facts_to_str(user_data: Dict[str, str]) -> str:
     return "\n".join(facts).join(["\n", "\n"])
 
 
+@handler_metrics
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(
         "Hi, I'm Gnosis Bot and I'm here to help you staking your RON."
     )
     chat_id = update.effective_message.chat_id
-    interval_type = context.user_data.get("interval-type")
-    stake_time = context.user_data.get("stake-time")
-    time = datetime.strptime(stake_time, "%H:%M")
-
-    if interval_type == "daily":
-        context.job_queue.run_daily(callback=call_staking,time=time, chat_id=chat_id,
-                                    name=str(chat_id), data=context.user_data)
-    elif interval_type == "monthly":
-        context.job_queue.run_monthly(callback=call_staking, when=time, chat_id=chat_id,
-                                    name=str(chat_id),  data=context.user_data)
-    elif interval_type == "custom":
-        interval = context.user_data.get("interval")
-        context.job_queue.run_repeating(callback=call_staking, interval=interval, chat_id=chat_id,
-                                    name=str(chat_id),  data=context.user_data)
+    now = datetime.now(timezone.utc)
+    if context.user_data.get("interval-type") == "monthly":
+        context.user_data["day"] = now.day
+    try:
+        schedule_engine.add(chat_id, update.effective_user.id, context.user_data, now)
+    except ValueError as error:
+        running = " The job that was already running is unchanged." if chat_id in schedule_engine else ""
+        await update.effective_message.reply_text(
+            f"Cannot start the job, {error}. Use /setting to fix it.{running}")
+        return
+    # Remember the chat, so the schedule is restored after a restart
+    context.user_data["job-chat-id"] = chat_id
     text = f"Job {chat_id} started"
     await update.effective_message.reply_text(text)
 
+
+@handler_metrics
 async def help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Displays info on how to use the bot."""
     await update.message.reply_text(
@@ -87,11 +114,13 @@ async def help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "Use /set_safe_info to set info for onchain transactions. \n"
         "Use /setting to set info of job schedule. \n"
         "Use /show_data to show all cached data. \n"
+        "Use /status to show your Safe's stake and rewards on chain. \n"
         "Use /stop to stop all jobs."
     )
 
 
 
+@handler_metrics
 async def setting(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     reply_keyboard = [["daily", "monthly", "yearly", "custom"]]
     await update.message.reply_text("Set the job interval type: ",
@@ -102,6 +131,7 @@ async def setting(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     return SELECTING_INTERVAL_TYPE
 
 
+@handler_metrics
 async def save_interval_type(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     interval_type = update.message.text
     is_custom = interval_type == "custom"
@@ -122,8 +152,15 @@ async def save_interval_type(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return ENTER_STAKE_TIME
 
 
+@handler_metrics
 async def save_interval(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     interval = int(update.message.text)
+    if interval < SCHEDULE_BUCKET_SECONDS:
+        # The schedule engine runs each chat at most once per bucket
+        await update.message.reply_text(
+            f"The interval must be at least {SCHEDULE_BUCKET_SECONDS} seconds, please try again: "
+        )
+        return ENTER_INTERVAL
     context.user_data["interval"] = interval
     logger.info("Interval time: %s", interval)
     await update.message.reply_text(
@@ -135,6 +172,7 @@ async def save_interval(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
     return ENTER_STAKE_TIME
 
 
+@handler_metrics
 async def save_staking_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     stake_time = update.message.text
     context.user_data["stake-time"] = stake_time
@@ -148,6 +186,7 @@ async def save_staking_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return ENTER_UNSTAKE_TIME
 
 
+@handler_metrics
 async def save_unstake_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     unstake_time = update.message.text
     context.user_data["unstake-time"] = unstake_time
@@ -161,6 +200,7 @@ async def save_unstake_time(update: Update, context: ContextTypes.DEFAULT_TYPE)
     return END
 
 
+@handler_metrics
 async def set_stake_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     reply_keyboard = [["ronin-mainnet", "ronin-testnet"]]
     await update.message.reply_text("Choose your network",
@@ -171,6 +211,7 @@ async def set_stake_info(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return SELECTING_NETWORK
 
 
+@handler_metrics
 async def save_network(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     network = update.message.text
     context.user_data["network"] = network
@@ -184,6 +225,7 @@ async def save_network(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     return ENTER_SAFE_WALLET
 
 
+@handler_metrics
 async def save_safe_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     safe_wallet = update.message.text
     context.user_data["safe-wallet"] = safe_wallet
@@ -197,25 +239,45 @@ async def save_safe_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     return ENTER_VALIDATOR
 
 
+@handler_metrics
 async def save_validator(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    validator = update.message.text
-    context.user_data["validator"] = validator
-    logger.info("Validator: %s", validator)
+    # Already loaded by `load_chain_stack` unless the bot only just started
+    from eth_utils import to_checksum_address
+
+    addresses = LIST_SEPARATOR.split(update.message.text.strip())
+    validators = [to_checksum_address(address) for address in addresses]
+    # Jobs keep using the saved validators until their amounts are entered too
+    context.user_data["pending-validators"] = validators
+    logger.info("Validators: %s", validators)
     await update.message.reply_text(
-        f"Success adding validator! Validator wallet: {validator}"
+        f"Success adding validators! Validator wallets: {', '.join(validators)}"
     )
     await update.message.reply_text(
-        "Now enter amount staking: "
+        "Now enter amount staking, one amount for every validator or one per validator in the same order: "
     )
     return ENTER_STAKING_AMOUNT
 
 
+@handler_metrics
 async def save_staking_amount(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    staking_amount = update.message.text
-    context.user_data["staking-amount"] = int(staking_amount)
-    logger.info("Staking amount: %s", staking_amount)
+    staking_amounts = [int(amount) for amount in LIST_SEPARATOR.split(update.message.text.strip())]
+    validators = context.user_data.get("pending-validators") or context.user_data["validators"]
+    if len(staking_amounts) == 1:
+        staking_amounts = staking_amounts * len(validators)
+    if len(staking_amounts) != len(validators):
+        await update.message.reply_text(
+            f"You entered {len(staking_amounts)} amounts for {len(validators)} validators, please try again: "
+        )
+        return ENTER_STAKING_AMOUNT
+    context.user_data["validators"] = validators
+    context.user_data["staking-amounts"] = staking_amounts
+    context.user_data.pop("pending-validators", None)
+    # Drop the single validator keys saved before multi-validator support
+    context.user_data.pop("validator", None)
+    context.user_data.pop("staking-amount", None)
+    logger.info("Staking amounts: %s", staking_amounts)
     await update.message.reply_text(
-        f"Success adding staking amount! Staking amount: {staking_amount}"
+        f"Success adding staking amount! Staking amount: {', '.join(map(str, staking_amounts))}"
     )
     await update.message.reply_text(
         "Done!!."
@@ -223,20 +285,12 @@ async def save_staking_amount(update: Update, context: ContextTypes.DEFAULT_TYPE
     return END
 
 
-def remove_job_if_exists(name: str, context: ContextTypes.DEFAULT_TYPE) -> bool:
-    """Remove job with given name. Returns whether job was removed."""
-    current_jobs = context.job_queue.get_jobs_by_name(name)
-    if not current_jobs:
-        return False
-    for job in current_jobs:
-        job.schedule_removal()
-    return True
-
-
+@handler_metrics
 async def stop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Remove the job if the user changed their mind."""
     chat_id = update.message.chat_id
-    job_removed = remove_job_if_exists(str(chat_id), context)
+    context.user_data.pop("job-chat-id", None)
+    job_removed = schedule_engine.remove(chat_id)
     text = "Bot successfully cancelled!" if job_removed else "You have no active timer."
     await update.message.reply_text(text)
 
@@ -248,6 +302,7 @@ def get_tx_url(network: str, tx_hash: str) -> str:
         return f"{EXPLORER_HOST_MAINNET}/tx/{tx_hash}"
 
 
+@handler_metrics
 async def show_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Display the gathered info."""
     await update.message.reply_text(
@@ -255,56 +310,242 @@ async def show_data(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
-async def call_staking(context: ContextTypes.DEFAULT_TYPE) -> None:
+def format_ron(wei: int) -> str:
+    return f"{Decimal(wei) / 10 ** 18:.4f} RON"
+
+
+def format_status(result: StakingStatus) -> str:
+    lines = [f"At block {result.block_number}:"]
+    for validator in result.validators:
+        lines.append(f"{validator.validator}\n  staked {format_ron(validator.staked)}, "
+                     f"reward {format_ron(validator.reward)}, pool total {format_ron(validator.pool_total)}")
+    lines.append(f"Total staked {format_ron(sum(v.staked for v in result.validators))}, "
+                 f"pending rewards {format_ron(sum(v.reward for v in result.validators))}")
+    return "\n".join(lines)
+
+
+@handler_metrics
+async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show the Safe's stake, pending rewards and the pool totals of its validators, read from chain."""
+    user_data = context.user_data
+    if "safe-wallet" not in user_data or not ("validators" in user_data or "validator" in user_data):
+        await update.message.reply_text("Use /set_stake_info first.")
+        return
+    network = user_data["network"]
+    safe_address = user_data["safe-wallet"]
+    validators = user_data.get("validators") or [user_data["validator"]]
+    block_number = status_cache.head(network)
+    result = None
+    if block_number is not None:
+        result = status_cache.get(network, block_number, safe_address, validators)
+    if result is None:
+        try:
+            result = await run_blocking(network, fetch_status, network, safe_address, validators, block_number)
+        except Exception as error:
+            logger.warning("Cannot read staking status of %s on %s: %s", safe_address, network, error)
+            await update.message.reply_text(f"Cannot read staking status: {describe_error(error)}")
+            return
+        status_cache.put(network, safe_address, validators, result)
+    await update.message.reply_text(format_status(result))
+
+
+async def refresh_status_heads(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Move the /status cache to every new block as soon as it is seen."""
+    for network in status_cache.networks():
+        try:
+            status_cache.set_head(network, await run_blocking(network, fetch_block_number, network))
+        except Exception as error:
+            logger.warning("Cannot read head block of %s: %s", network, error)
+
+
+async def dispatch_schedule(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Run every stake/unstake event of the current bucket as one Safe transaction per network, safe and kind."""
+    now = datetime.now(timezone.utc)
+    due = schedule_engine.pop_due(now)
+    # Their next runs moved, save them so a restart resumes from there
+    context.application.mark_data_for_update_persistence(user_ids=[event.user_id for event in due])
+    for event in due:
+        SCHEDULE_LAG_SECONDS.observe((now - event.planned).total_seconds(), kind=event.kind)
+    groups = group_events(due)
+    for safe_groups in group_by_safe(groups).values():
+        # Safes run as their own tasks, so a slow RPC never delays the next bucket
+        context.application.create_task(call_staking_in_order(context, safe_groups, groups))
+
+
+async def prepare_schedule(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Build and sign the Safe txs of the bucket due in `PREPARE_LEAD_SECONDS`, so it only has to broadcast them."""
+    upcoming = schedule_engine.peek_bucket(datetime.now(timezone.utc) + timedelta(seconds=PREPARE_LEAD_SECONDS))
+    groups = group_events(upcoming)
+    for safe_groups in group_by_safe(groups).values():
+        context.application.create_task(prepare_in_order(safe_groups, groups))
+
+
+async def prepare_in_order(safe_groups: List[EventGroup], groups: Dict[EventGroup, List[DueEvent]]) -> None:
+    # A Safe's groups take consecutive nonces, in the order `dispatch_schedule` sends them
+    for group in safe_groups:
+        await prepare_group(group, groups[group])
+
+
+async def prepare_group(group: EventGroup, events: List[DueEvent]) -> None:
+    from staking import prepare_staking, prepare_unstaking
+
+    network, safe_address, kind = group
+    prepare = prepare_staking if kind == STAKE else prepare_unstaking
+    try:
+        safe_address, delegations = group_delegations(events)
+        await run_blocking(network, prepare, network, safe_address, delegations)
+    except Exception:
+        # The dispatch builds the tx from scratch and reports the error to the chats if it fails again
+        logger.warning("Cannot prepare %s tx of %s on %s", kind, safe_address, network, exc_info=True)
+
+
+def group_delegations(events: List[DueEvent]) -> Tuple[str, "Delegations"]:
+    from staking import get_delegations, merge_delegations
+
+    # Every event of the group shares the Safe, take the address as the user typed it
+    safe_address = events[0].user_data["safe-wallet"]
+    return safe_address, merge_delegations(*(get_delegations(event.user_data) for event in events))
+
+
+def describe_error(error: Exception) -> str:
+    import requests
+
+    if isinstance(error, requests.RequestException):
+        # Their message holds the endpoint URL, API key included
+        return f"{type(error).__name__} from every RPC endpoint"
+    return f"{type(error).__name__}: {error}"[:300]
+
+
+async def call_staking_in_order(context: ContextTypes.DEFAULT_TYPE, safe_groups: List[EventGroup],
+                                groups: Dict[EventGroup, List[DueEvent]]) -> None:
+    # One after the other, so each group reserves the Safe nonce its tx was prepared for
+    for group in safe_groups:
+        await call_staking(context, group, groups[group])
+
+
+async def call_staking(context: ContextTypes.DEFAULT_TYPE, group: EventGroup, events: List[DueEvent]) -> None:
     """Call staking"""
-    job = context.job
-    print(job.data)
-    safe_address = job.data["safe-wallet"]
-    validator = job.data["validator"]
-    network = job.data["network"]
-    staking_amount = job.data["staking-amount"]
-    if network == "ronin-testnet":
-        staking_address = STAKING_PROXY_TESTNET
-        rpc_url = f"{testnet_rpc_url}?apikey={api_key}"
-    else:
-        staking_address = STAKING_PROXY_MAINNET
-        rpc_url = f"{mainnet_rpc_url}?apikey={api_key}"
+    from staking import execute_staking, execute_unstaking, get_executor_address
+
+    start = time.perf_counter()
+    network, safe_address, kind = group
+    execute = execute_staking if kind == STAKE else execute_unstaking
+    trace = JobTrace(network=network, safe=safe_address, kind=kind, chats=[event.chat_id for event in events],
+                     planned=min(event.planned for event in events))
+    tx_hash = error = None
+    try:
+        # Inside the `try`, so a chat with broken stake info gets the error like any other failure
+        safe_address, delegations = group_delegations(events)
+        # Web3 calls block, so the job waits on the network's worker pool instead of stalling the event loop
+        tx_hash = (await run_blocking(network, traced(trace, execute), network, safe_address, delegations)).hex()
+        receipt_tracker.track(network, tx_hash, [event.chat_id for event in events], safe_address,
+                              get_executor_address())
+        text = f"TxHash: {get_tx_url(network, tx_hash)}"
+    except Exception as exc:
+        error = exc
+        logger.exception("%s job of Safe %s on %s failed", kind, safe_address, network)
+        text = f"Revert with {describe_error(error)}"
+    for event in events:
+        await context.bot.send_message(event.chat_id, text=text)
+
+    outcome = "sent" if error is None else "failed"
+    STAKING_JOBS.inc(network=network, kind=kind, outcome=outcome)
+    STAKING_JOB_SECONDS.observe(time.perf_counter() - start, network=network, kind=kind)
+    if METRICS_TRACE_PATH:
+        trace.dump(METRICS_TRACE_PATH, outcome=outcome, tx_hash=tx_hash, error=error and describe_error(error),
+                   seconds=time.perf_counter() - start)
+
+
+async def check_receipts(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Poll the receipts of every pending tx, one batch per network, and report the ones that are final."""
+    await asyncio.gather(*(check_network_receipts(context, network) for network in receipt_tracker.networks()))
+
+
+async def check_network_receipts(context: ContextTypes.DEFAULT_TYPE, network: str) -> None:
     try:
-        # Create the web3 and contract instance
-        w3 = Web3(Web3.HTTPProvider(rpc_url))
-        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-        ethereum_client = EthereumClient(rpc_url)
-        staking_contract = w3.eth.contract(address=staking_address, abi=STAKING_ABI)
-        safe = Safe(safe_address, ethereum_client)
-
-        safe_info = safe.retrieve_all_info()
-        logger.info("safe info: ", safe_info)
-        data = staking_contract.encodeABI(fn_name='delegate', args=[validator])
-        logger.info("delegate info: ", str(data))
-
-        gas = safe.estimate_tx_gas(to=staking_address, value=staking_amount, data=data,
-                                   operation=OPERATION_DELEGATE_CALL)
-        logger.info("estimate gas: ", gas)
-        safe_tx = safe.build_multisig_tx(to=staking_address, value=staking_amount, data=data, safe_tx_gas=gas)
-        logger.info("safe_tx: ", safe_tx)
-        # owner 1 sign
-        safe_tx.sign(private_key)
-        is_success = safe_tx.call() == 1
-        logger.info("check safe_tx ok: ", is_success)
-        logger.info(w3.eth.get_block('latest'))
-        (tx_hash, tx) = safe_tx.execute(private_key)
-        logger.info("tx", tx)
-        await context.bot.send_message(job.chat_id, text=f"TxHash: {get_tx_url(network, tx_hash.hex())}")
+        receipts = await run_blocking(network, fetch_receipts, network, receipt_tracker.hashes(network))
     except Exception as error:
-        # handle the exception
-        logger.error("An exception occurred:", error)
-        await context.bot.send_message(job.chat_id, text=f"Revert with {type(error).__name__}")
+        logger.warning("Cannot poll receipts on %s: %s", network, error)
+        return
+    for tx_hash, receipt in receipts.items():
+        settled = receipt_tracker.settle(tx_hash, receipt)
+        if settled is None:
+            continue
+        info, status = settled
+        STAKING_RECEIPTS.inc(network=network, status=status)
+        text = f"Tx {get_tx_url(network, tx_hash)} {status}"
+        if receipt is not None:
+            text += f" in block {int(receipt['blockNumber'], 16)}, gas used {int(receipt['gasUsed'], 16)}"
+        for chat_id in info["chat-ids"]:
+            await context.bot.send_message(chat_id, text=text)
+
+
+def load_chain_stack() -> None:
+    """
+    Import web3 and safe-eth-py, which takes seconds.
+
+    Modules that need them import them where they are used, so the bot starts polling without waiting for
+    them, and a handler that runs before this is done only waits for the rest of the load.
+    """
+    importlib.import_module("staking")
+
+
+async def post_init(application: Application) -> None:
+    global metrics_server
+    # Not awaited, polling starts while the imports run in a worker thread
+    asyncio.get_running_loop().run_in_executor(None, load_chain_stack)
+    now = datetime.now(timezone.utc)
+    restored = []
+    for user_id, user_data in application.user_data.items():
+        if "job-chat-id" in user_data:
+            try:
+                # Resumed from the saved next runs, only `/start` runs a custom schedule right away
+                schedule_engine.add(user_data["job-chat-id"], user_id, user_data, now, resume=True)
+                restored.append(user_id)
+            except ValueError as error:
+                logger.warning("Cannot restore the schedule of chat %s: %s", user_data["job-chat-id"], error)
+    # Missed runs were skipped, and schedules saved before next runs were kept have them now
+    application.mark_data_for_update_persistence(user_ids=restored)
+    logger.info("Restored %s schedules", len(schedule_engine))
+    # The tracker keeps working on the dict stored in bot_data, so pending txs are persisted with it
+    receipt_tracker.pending.update(application.bot_data.get("pending-txs", {}))
+    application.bot_data["pending-txs"] = receipt_tracker.pending
+    logger.info("Restored %s pending txs", len(receipt_tracker.pending))
+    application.job_queue.run_repeating(dispatch_schedule, interval=SCHEDULE_BUCKET_SECONDS,
+                                        first=schedule_engine.seconds_to_next_bucket(now), name="schedule")
+    if PREPARE_LEAD_SECONDS:
+        # Runs a second into every bucket boundary minus the lead, so `now + lead` falls in the next bucket
+        lead = timedelta(seconds=PREPARE_LEAD_SECONDS)
+        application.job_queue.run_repeating(prepare_schedule, interval=SCHEDULE_BUCKET_SECONDS,
+                                            first=schedule_engine.seconds_to_next_bucket(now + lead) + 1,
+                                            name="prepare")
+    application.job_queue.run_repeating(check_receipts, interval=RECEIPT_POLL_SECONDS, name="receipts")
+    if METRICS_PORT:
+        metrics_server = start_server(METRICS_ADDRESS, METRICS_PORT)
+    if STATUS_BLOCK_POLL_SECONDS:
+        application.job_queue.run_repeating(refresh_status_heads, interval=STATUS_BLOCK_POLL_SECONDS,
+                                            name="status-head")
+
+
+async def post_shutdown(application: Application) -> None:
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    executor.shutdown()
 
 
 def main():
     # Create the telegram bot application
-    persistence = PicklePersistence(filepath="gnosis")
-    application = Application.builder().token(telegram_token).persistence(persistence).build()
+    if not os.path.exists(PERSISTENCE_PATH) and os.path.exists(LEGACY_PICKLE_PATH):
+        migrate_pickle(LEGACY_PICKLE_PATH, PERSISTENCE_PATH)
+    persistence = SQLitePersistence(filepath=PERSISTENCE_PATH)
+    application = (
+        Application.builder()
+        .token(telegram_token)
+        .persistence(persistence)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     staking_handler = ConversationHandler(
         entry_points=[
@@ -313,8 +554,9 @@ def main():
         states={
             SELECTING_NETWORK: [MessageHandler(filters.Regex("^(ronin-mainnet|ronin-testnet)$"), save_network)],
             ENTER_SAFE_WALLET: [MessageHandler(filters.Regex("^0x[a-fA-F0-9]{40}$"), save_safe_wallet)],
-            ENTER_VALIDATOR: [MessageHandler(filters.Regex("^0x[a-fA-F0-9]{40}$"), save_validator)],
-            ENTER_STAKING_AMOUNT: [MessageHandler(filters.Regex("^\d+$"), save_staking_amount)],
+            ENTER_VALIDATOR: [
+                MessageHandler(filters.Regex("^0x[a-fA-F0-9]{40}([\s,]+0x[a-fA-F0-9]{40})*$"), save_validator)],
+            ENTER_STAKING_AMOUNT: [MessageHandler(filters.Regex("^\d+([\s,]+\d+)*$"), save_staking_amount)],
         },
         fallbacks=[
             CommandHandler("stop", stop)
@@ -344,6 +586,7 @@ def main():
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("show_data", show_data))
+    application.add_handler(CommandHandler("status", status))
     application.add_handler(CommandHandler("stop", stop))
     application.add_handler(CommandHandler("help", help))
     application.add_handler(staking_handler)
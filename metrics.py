@@ -0,0 +1,227 @@
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a cached read to a slow node answering a whole job
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        """The metric's lines in the Prometheus text format, one per label set (and bucket)."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        super().__init__(name, description, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.label_names, key)} {value:g}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(buckets)
+        # Per label set: non-cumulative bucket counts (the last one is +Inf), sum and count
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+        names = self.label_names + ("le",)
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket{_format_labels(names, key + (le,))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.label_names, key)} {total:g}"
+            yield f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+STAKING_PHASE_SECONDS = registry.register(Histogram(
+    "staking_phase_seconds", "Time spent in each phase of building and sending Safe transactions, prepared ones included.",
+    ["network", "phase"]))
+STAKING_JOB_SECONDS = registry.register(Histogram(
+    "staking_job_seconds", "Time from the start of a staking job to its replies being sent.", ["network", "kind"]))
+STAKING_JOBS = registry.register(Counter(
+    "staking_jobs_total", "Staking jobs by outcome.", ["network", "kind", "outcome"]))
+STAKING_RECEIPTS = registry.register(Counter(
+    "staking_receipts_total", "Final status of the txs sent by staking jobs.", ["network", "status"]))
+SCHEDULE_LAG_SECONDS = registry.register(Histogram(
+    "schedule_lag_seconds", "Delay between an event's planned time and its dispatch.", ["kind"]))
+RPC_CALLS = registry.register(Counter(
+    "rpc_calls_total", "JSON-RPC calls sent, batched calls counted one by one.", ["endpoint", "method"]))
+RPC_REQUEST_BYTES = registry.register(Counter(
+    "rpc_request_bytes_total", "JSON-RPC request bytes, a batch split evenly between its calls.",
+    ["endpoint", "method"]))
+RPC_RESPONSE_BYTES = registry.register(Counter(
+    "rpc_response_bytes_total", "JSON-RPC response bytes, a batch split evenly between its calls.",
+    ["endpoint", "method"]))
+RPC_POST_SECONDS = registry.register(Histogram(
+    "rpc_post_seconds", "Duration of JSON-RPC HTTP posts.", ["endpoint", "outcome"]))
+HANDLER_SECONDS = registry.register(Histogram(
+    "bot_handler_seconds", "Duration of command and conversation handlers.", ["handler", "outcome"]))
+
+
+class JobTrace:
+    """Phases of one staking job, written as a JSON line to the trace file when it is enabled."""
+
+    def __init__(self, **fields: Any):
+        self.fields = fields
+        self.phases: List[Tuple[str, float]] = []
+        self.started = time.time()
+
+    def dump(self, path: str, **fields: Any) -> None:
+        record = {**self.fields, **fields, "started": self.started,
+                  "phases": [{"phase": name, "seconds": round(seconds, 6)} for name, seconds in self.phases]}
+        with _trace_lock, open(path, "a") as file:
+            file.write(json.dumps(record, default=str) + "\n")
+
+
+_trace_lock = threading.Lock()
+_local = threading.local()
+
+
+def traced(trace: JobTrace, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Wrap a blocking job so the phases it times in its worker thread are also added to `trace`."""
+
+    @functools.wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        _local.trace = trace
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.trace = None
+
+    return wrapper
+
+
+@contextmanager
+def phase(network: str, name: str) -> Iterator[None]:
+    """Time one phase of sending a Safe transaction."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAKING_PHASE_SECONDS.observe(seconds, network=network, phase=name)
+        trace: Optional[JobTrace] = getattr(_local, "trace", None)
+        if trace is not None:
+            trace.phases.append((name, seconds))
+
+
+def handler_metrics(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Time a telegram handler and count its failures."""
+
+    @functools.wraps(func)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await func(*args, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, handler=func.__name__, outcome=outcome)
+
+    return wrapper
+
+
+def start_server(address: str, port: int) -> ThreadingHTTPServer:
+    """Serve every metric in the Prometheus text format on `/metrics`, from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Serving metrics on http://%s:%s/metrics", address, server.server_port)
+    return server
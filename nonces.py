@@ -0,0 +1,64 @@
+import logging
+import threading
+from typing import Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class NonceManager:
+    """
+    In-process nonce counters, so several transactions from the same executor key or Safe can be in flight.
+
+    Callers pass the nonce the node reports with every reservation. The local counter wins while it is ahead
+    (our own transactions are still pending), the chain wins as soon as it catches up or moves past it, so
+    transactions sent by someone else are picked up without an explicit resync.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next: Dict[Hashable, int] = {}
+
+    def reserve(self, chain_nonces: Dict[Hashable, int]) -> List[int]:
+        """
+        Reserve the next nonce of every key at once, in the order of `chain_nonces`.
+
+        Reserving the Safe and the executor nonce together keeps their order consistent between jobs, so the
+        transaction with the lower Safe nonce is also the one that gets mined first.
+        """
+        with self._lock:
+            nonces = []
+            for key, chain_nonce in chain_nonces.items():
+                nonce = max(self._next.get(key, 0), chain_nonce)
+                self._next[key] = nonce + 1
+                nonces.append(nonce)
+            return nonces
+
+    def peek(self, key: Hashable, chain_nonce: int) -> int:
+        """The nonce `reserve` would hand out next, without reserving it."""
+        with self._lock:
+            return max(self._next.get(key, 0), chain_nonce)
+
+    def release(self, key: Hashable, nonce: int) -> None:
+        """Give back a nonce that was never broadcast. Later nonces already out leave a gap, so resync instead."""
+        with self._lock:
+            if self._next.get(key) == nonce + 1:
+                self._next[key] = nonce
+            else:
+                logger.warning("Nonce %s of %s left a gap, resyncing from chain", nonce, key)
+                self._next.pop(key, None)
+
+    def resync(self, key: Hashable) -> None:
+        """Forget the local counter, the next reservation starts from the chain's nonce again."""
+        with self._lock:
+            self._next.pop(key, None)
+
+
+def safe_nonce_key(network: str, safe_address: str) -> Tuple[str, str, str]:
+    return "safe", network, safe_address
+
+
+def sender_nonce_key(network: str, sender: str) -> Tuple[str, str, str]:
+    return "sender", network, sender
+
+
+nonce_manager = NonceManager()
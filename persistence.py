@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import sys
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS chat_data (id INTEGER PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS bot_data (name TEXT PRIMARY KEY, data BLOB NOT NULL);
+CREATE TABLE IF NOT EXISTS conversations (
+    name TEXT NOT NULL,
+    key BLOB NOT NULL,
+    state BLOB NOT NULL,
+    PRIMARY KEY (name, key)
+);
+"""
+
+
+# Conversation keys are tuples of chat/user ids
+ConversationKey = Tuple[int, ...]
+
+
+def _dumps(obj: Any) -> bytes:
+    return pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class SQLitePersistence(BasePersistence[Dict[Any, Any], Dict[Any, Any], Dict[Any, Any]]):
+    """
+    Persistence that stores one SQLite row per user, chat and conversation key.
+
+    Unlike `PicklePersistence` it never rewrites or keeps a copy of the whole data set: every `update_*`
+    call upserts only the row it was given (and skips it when the pickled value did not change), rows are
+    read only when the `Application` asks for them, and all writes of one `update_persistence` run are
+    committed together. The database runs in WAL mode, so a crash mid-write can not corrupt earlier rows.
+    """
+
+    def __init__(self, filepath: str, store_data: Optional[PersistenceInput] = None, update_interval: float = 60):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.filepath = filepath
+        self._conn = sqlite3.connect(filepath, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        # Digest of the last written value per row, to skip rewriting rows that were only read
+        self._digests: Dict[Tuple[str, Any], bytes] = {}
+        self._commit_scheduled = False
+
+    def _schedule_commit(self) -> None:
+        # `Application.update_persistence` gathers all its `update_*` calls, so a callback queued behind
+        # them commits the whole run in one transaction
+        if not self._commit_scheduled:
+            self._commit_scheduled = True
+            asyncio.get_running_loop().call_soon(self._commit)
+
+    def _commit(self) -> None:
+        self._commit_scheduled = False
+        self._conn.commit()
+
+    def _is_dirty(self, table: str, key: Any, blob: bytes) -> bool:
+        digest = hashlib.blake2b(blob, digest_size=16).digest()
+        if self._digests.get((table, key)) == digest:
+            return False
+        self._digests[(table, key)] = digest
+        return True
+
+    def _load_rows(self, table: str) -> Dict[int, Dict[Any, Any]]:
+        rows = self._conn.execute(f"SELECT id, data FROM {table}")
+        return {row_id: pickle.loads(data) for row_id, data in rows}
+
+    def _upsert(self, table: str, key: Any, data: Any) -> None:
+        blob = _dumps(data)
+        if not self._is_dirty(table, key, blob):
+            return
+        column = "name" if table == "bot_data" else "id"
+        self._conn.execute(f"INSERT OR REPLACE INTO {table} ({column}, data) VALUES (?, ?)", (key, blob))
+        self._schedule_commit()
+
+    def _delete(self, table: str, key: Any) -> None:
+        self._digests.pop((table, key), None)
+        column = "name" if table == "bot_data" else "id"
+        self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+        self._schedule_commit()
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return self._load_rows("user_data")
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return self._load_rows("chat_data")
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        row = self._conn.execute("SELECT data FROM bot_data WHERE name = 'bot_data'").fetchone()
+        return pickle.loads(row[0]) if row else {}
+
+    async def get_callback_data(self) -> Optional[Any]:
+        row = self._conn.execute("SELECT data FROM bot_data WHERE name = 'callback_data'").fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    async def get_conversations(self, name: str) -> Dict[ConversationKey, object]:
+        rows = self._conn.execute("SELECT key, state FROM conversations WHERE name = ?", (name,))
+        return {pickle.loads(key): pickle.loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        blob_key = _dumps(key)
+        # A missing key and a `None` state both mean "no conversation", so ended conversations are deleted
+        if new_state is None:
+            self._digests.pop(("conversations", (name, blob_key)), None)
+            self._conn.execute("DELETE FROM conversations WHERE name = ? AND key = ?", (name, blob_key))
+            self._schedule_commit()
+            return
+        state = _dumps(new_state)
+        if not self._is_dirty("conversations", (name, blob_key), state):
+            return
+        self._conn.execute("INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)",
+                           (name, blob_key, state))
+        self._schedule_commit()
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._upsert("user_data", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._upsert("chat_data", chat_id, data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        self._upsert("bot_data", "bot_data", data)
+
+    async def update_callback_data(self, data: Any) -> None:
+        self._upsert("bot_data", "callback_data", data)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._delete("chat_data", chat_id)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._delete("user_data", user_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def flush(self) -> None:
+        self._commit()
+        self._conn.close()
+
+
+class _MigrationUnpickler(pickle.Unpickler):
+    """`PicklePersistence` swaps the bot for a persistent id, there is no bot to put back while migrating."""
+
+    def persistent_load(self, pid: str) -> None:
+        return None
+
+
+def migrate_pickle(pickle_path: str, db_path: str) -> None:
+    """Copy a single-file `PicklePersistence` into a new SQLite database."""
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists, refusing to overwrite it")
+    with open(pickle_path, "rb") as file:
+        data = _MigrationUnpickler(file).load()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    with conn:
+        conn.executemany("INSERT INTO user_data (id, data) VALUES (?, ?)",
+                         [(key, _dumps(value)) for key, value in data["user_data"].items()])
+        conn.executemany("INSERT INTO chat_data (id, data) VALUES (?, ?)",
+                         [(key, _dumps(value)) for key, value in data["chat_data"].items()])
+        conn.execute("INSERT INTO bot_data (name, data) VALUES ('bot_data', ?)", (_dumps(data.get("bot_data", {})),))
+        if data.get("callback_data") is not None:
+            conn.execute("INSERT INTO bot_data (name, data) VALUES ('callback_data', ?)",
+                         (_dumps(data["callback_data"]),))
+        conn.executemany("INSERT INTO conversations (name, key, state) VALUES (?, ?, ?)", [
+            (name, _dumps(key), _dumps(state))
+            for name, states in data["conversations"].items()
+            for key, state in states.items()
+            if state is not None
+        ])
+    conn.close()
+    logger.info("Migrated %s users and %s chats from %s to %s",
+                len(data["user_data"]), len(data["chat_data"]), pickle_path, db_path)
+
+
+if __name__ == '__main__':
+    # python persistence.py <pickle file> <sqlite file>
+    logging.basicConfig(level=logging.INFO)
+    migrate_pickle(sys.argv[1], sys.argv[2])
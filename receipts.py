@@ -0,0 +1,81 @@
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import RECEIPT_TIMEOUT_SECONDS
+from nonces import nonce_manager, safe_nonce_key, sender_nonce_key
+
+logger = logging.getLogger(__name__)
+
+# keccak("ExecutionFailure(bytes32,uint256)"), emitted when the Safe tx is mined but its inner call failed
+EXECUTION_FAILURE_TOPIC = "0x23428b18acfb3ea64b08dc0c1d296ea9c09702c09083ca5272e64d115b687d23"
+
+
+def fetch_receipts(network: str, tx_hashes: List[str]) -> Dict[str, Optional[dict]]:
+    """Get the receipts of every given tx in one batch, `None` for the ones not mined yet. Blocking."""
+    # The chain stack is imported on first use, so the bot does not wait for it to start polling
+    from clients import get_client
+    from rpc_batch import RpcError
+
+    futures = get_client(network).batcher.call_many(
+        [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes]
+    )
+    receipts = {}
+    for tx_hash, future in zip(tx_hashes, futures):
+        try:
+            receipts[tx_hash] = future.result()
+        except RpcError as error:
+            logger.warning("Cannot get receipt of %s: %s", tx_hash, error)
+            receipts[tx_hash] = None
+    return receipts
+
+
+class ReceiptTracker:
+    """
+    Pending txs by hash, until their receipt shows they were mined, reverted or dropped.
+
+    `pending` only holds plain dicts, so it can live in `bot_data` and survive restarts.
+    """
+
+    def __init__(self):
+        self.pending: Dict[str, dict] = {}
+
+    def track(self, network: str, tx_hash: str, chat_ids: List[int], safe_address: str, sender: str) -> None:
+        from eth_utils import to_checksum_address
+
+        self.pending[tx_hash] = {
+            "network": network,
+            "chat-ids": chat_ids,
+            "safe": to_checksum_address(safe_address),
+            "sender": sender,
+            "sent-at": time.time(),
+        }
+
+    def networks(self) -> Set[str]:
+        return {info["network"] for info in self.pending.values()}
+
+    def hashes(self, network: str) -> List[str]:
+        return [tx_hash for tx_hash, info in self.pending.items() if info["network"] == network]
+
+    def settle(self, tx_hash: str, receipt: Optional[dict]) -> Optional[Tuple[dict, str]]:
+        """Forget the tx once it is final and return its info and status, `None` while it is still pending."""
+        info = self.pending[tx_hash]
+        network = info["network"]
+        if receipt is None:
+            if time.time() - info["sent-at"] < RECEIPT_TIMEOUT_SECONDS:
+                return None
+            status = "dropped"
+            # Neither nonce was used, later reservations must start from the chain again
+            nonce_manager.resync(safe_nonce_key(network, info["safe"]))
+            nonce_manager.resync(sender_nonce_key(network, info["sender"]))
+        elif int(receipt["status"], 16) == 0:
+            status = "reverted"
+            # A reverted `execTransaction` does not increase the Safe nonce
+            nonce_manager.resync(safe_nonce_key(network, info["safe"]))
+        elif any(log["topics"] and log["topics"][0] == EXECUTION_FAILURE_TOPIC
+                 and log["address"].lower() == info["safe"].lower() for log in receipt["logs"]):
+            status = "failed inside the Safe"
+        else:
+            status = "success"
+        del self.pending[tx_hash]
+        return info, status
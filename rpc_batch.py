@@ -0,0 +1,93 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import eth_abi
+from hexbytes import HexBytes
+
+from rpc_router import NON_IDEMPOTENT_METHODS, RpcRouter
+
+logger = logging.getLogger(__name__)
+
+RpcCall = Tuple[str, list]
+
+
+class RpcError(Exception):
+    """JSON-RPC error returned for one entry of a batch."""
+
+    def __init__(self, method: str, error: Dict[str, Any]):
+        self.method = method
+        self.code = error.get("code")
+        self.data: Optional[str] = error.get("data")
+        super().__init__(f"{method}: {error.get('message')}")
+
+
+def decode_result(output_types: List[str], future: Future) -> Any:
+    """ABI-decode the single return value of an `eth_call` future."""
+    return eth_abi.decode(output_types, HexBytes(future.result()))[0]
+
+
+class RpcBatcher:
+    """
+    Coalesce JSON-RPC calls into one batch request per network.
+
+    The first caller to arrive waits `window` seconds, so reads from every job that fires in the same tick
+    ride along in its batch, then posts them all in one HTTP round-trip through the network's router.
+    """
+
+    def __init__(self, router: RpcRouter, window: float):
+        self.router = router
+        self.window = window
+        self._lock = threading.Lock()
+        self._pending: List[Tuple[RpcCall, Future]] = []
+        self._flushing = False
+
+    def call_many(self, calls: Sequence[RpcCall]) -> List[Future]:
+        """Queue `calls` and return one future per call, resolved with the raw `result` or an `RpcError`."""
+        futures = []
+        with self._lock:
+            for call in calls:
+                future = Future()
+                self._pending.append((call, future))
+                futures.append(future)
+            is_leader = not self._flushing
+            self._flushing = True
+        if is_leader:
+            if self.window:
+                time.sleep(self.window)
+            self._flush()
+        return futures
+
+    def _flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._flushing = False
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, ((method, params), _) in enumerate(pending)
+        ]
+        methods = [method for (method, _), _ in pending]
+        idempotent = not any(method in NON_IDEMPOTENT_METHODS for method in methods)
+        try:
+            results = self.router.post(json.dumps(payload).encode(), methods, idempotent=idempotent)
+            # Some nodes answer a broken batch with a single error object instead of a list
+            if isinstance(results, dict):
+                raise RpcError("batch", results.get("error", {}))
+        except Exception as error:
+            for _, future in pending:
+                future.set_exception(error)
+            return
+
+        logger.debug("Sent batch of %s calls", len(payload))
+        results_by_id = {result.get("id"): result for result in results}
+        for i, ((method, _), future) in enumerate(pending):
+            result = results_by_id.get(i)
+            if result is None:
+                future.set_exception(RpcError(method, {"message": "missing from batch response"}))
+            elif "error" in result:
+                future.set_exception(RpcError(method, result["error"]))
+            else:
+                future.set_result(result["result"])
@@ -0,0 +1,207 @@
+import logging
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, List, Sequence
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from web3.providers.base import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from metrics import RPC_CALLS, RPC_POST_SECONDS, RPC_REQUEST_BYTES, RPC_RESPONSE_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Sending these twice would broadcast twice, they never go to more than one endpoint
+NON_IDEMPOTENT_METHODS = frozenset({"eth_sendRawTransaction", "eth_sendTransaction"})
+
+# Weight of the newest sample in an endpoint's latency average
+LATENCY_ALPHA = 0.2
+# An endpoint that failed sits out this long, doubled for every further consecutive failure
+COOLDOWN_SECONDS = 5
+MAX_COOLDOWN_SECONDS = 300
+# Query strings of the URLs in an error message, the primary endpoint's holds the API key
+URL_QUERY = re.compile(r"\?[^\s'\")]+")
+
+
+class Endpoint:
+    """Health of one RPC endpoint, updated by every request the router sends to it."""
+
+    def __init__(self, url: str):
+        self.url = url
+        # Metrics label, without the path and query that may hold an API key
+        self.name = urlsplit(url).netloc
+        # Moving average in seconds, 0 until the first answer so untried endpoints get tried early
+        self.latency = 0.0
+        self.failures = 0
+        self.down_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    def is_healthy(self, now: float) -> bool:
+        return now >= self.down_until
+
+    def score(self) -> float:
+        """Lower is better."""
+        return self.latency * (1 + self.failures)
+
+    def record_success(self, seconds: float) -> None:
+        self.requests += 1
+        self.latency = seconds if not self.latency else LATENCY_ALPHA * seconds + (1 - LATENCY_ALPHA) * self.latency
+        self.failures = 0
+        self.down_until = 0.0
+
+    def record_failure(self) -> None:
+        self.requests += 1
+        self.errors += 1
+        self.failures += 1
+        cooldown = min(COOLDOWN_SECONDS * 2 ** (self.failures - 1), MAX_COOLDOWN_SECONDS)
+        self.down_until = time.monotonic() + cooldown
+
+
+def never_sent(error: Exception) -> bool:
+    """Whether the request failed before reaching the node, so another endpoint can safely get it."""
+    if hasattr(error, "never_sent"):
+        return error.never_sent
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError) and error.args:
+        reason = error.args[0]
+        return isinstance(reason, MaxRetryError) and isinstance(reason.reason, NewConnectionError)
+    return False
+
+
+def _redact(error: Exception) -> Exception:
+    """
+    `error`, or a copy of it without URL query strings in its message.
+
+    The copy is raised instead of the original so neither its message nor its chained urllib3 errors can
+    put the API key in a log line or traceback.
+    """
+    message = str(error)
+    redacted = URL_QUERY.sub("?<redacted>", message)
+    if redacted == message:
+        return error
+    clean = type(error)(redacted)
+    clean.never_sent = never_sent(error)
+    return clean
+
+
+class RpcRouter:
+    """
+    Send JSON-RPC requests to the best of several endpoints of the same network.
+
+    Endpoints are ranked by their latency average, weighted by consecutive failures, and a failing one is
+    skipped for a growing cooldown. Reads go to the best endpoint, are hedged to the second best when they
+    are slower than `hedge_delay` and are retried with backoff when every endpoint failed. Requests with a
+    method in `NON_IDEMPOTENT_METHODS` are sent once, and only move on to another endpoint when they
+    provably never left this host.
+    """
+
+    def __init__(self, urls: List[str], timeout: float, hedge_delay: float, retries: int, backoff: float):
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        # One keep-alive pool per endpoint, connection errors are retried by urllib3 since nothing was sent
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(urls), pool_maxsize=100, max_retries=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="rpc")
+
+    def ranked(self) -> List[Endpoint]:
+        """Healthy endpoints best first, then the ones cooling down, soonest back first."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = sorted((e for e in self.endpoints if e.is_healthy(now)), key=Endpoint.score)
+            down = sorted((e for e in self.endpoints if not e.is_healthy(now)), key=lambda e: e.down_until)
+        return healthy + down
+
+    def _post(self, endpoint: Endpoint, data: bytes, methods: Sequence[str]) -> Any:
+        start = time.monotonic()
+        for method in methods:
+            RPC_CALLS.inc(endpoint=endpoint.name, method=method)
+            RPC_REQUEST_BYTES.inc(len(data) / len(methods), endpoint=endpoint.name, method=method)
+        try:
+            response = self.session.post(endpoint.url, data=data, timeout=self.timeout,
+                                         headers={"Content-Type": "application/json"})
+            response.raise_for_status()
+            body = response.json()
+        except Exception as error:
+            with self._lock:
+                endpoint.record_failure()
+            RPC_POST_SECONDS.observe(time.monotonic() - start, endpoint=endpoint.name, outcome="error")
+            clean = _redact(error)
+            logger.warning("RPC endpoint %s failed: %s: %s", endpoint.name, type(clean).__name__, clean)
+            if clean is error:
+                raise
+            raise clean from None
+        seconds = time.monotonic() - start
+        with self._lock:
+            endpoint.record_success(seconds)
+        RPC_POST_SECONDS.observe(seconds, endpoint=endpoint.name, outcome="ok")
+        for method in methods:
+            RPC_RESPONSE_BYTES.inc(len(response.content) / len(methods), endpoint=endpoint.name, method=method)
+        return body
+
+    def post(self, data: bytes, methods: Sequence[str], idempotent: bool = True) -> Any:
+        """POST a JSON-RPC request or batch of `methods` and return the decoded response body."""
+        if not idempotent:
+            return self._post_once(data, methods)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                return self._post_hedged(data, methods)
+            except Exception as error:
+                if attempt == self.retries:
+                    raise
+                logger.info("RPC attempt %s failed (%s: %s), retrying", attempt + 1, type(error).__name__, error)
+
+    def _post_hedged(self, data: bytes, methods: Sequence[str]) -> Any:
+        ranked = self.ranked()
+        futures: List[Future] = [self._pool.submit(self._post, ranked[0], data, methods)]
+        if len(ranked) > 1:
+            # The second endpoint only gets the request if the first is slow or already failed
+            done, _ = wait(futures, timeout=self.hedge_delay or None)
+            if not done or futures[0].exception() is not None:
+                futures.append(self._pool.submit(self._post, ranked[1], data, methods))
+        error = None
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    # A slower duplicate read is harmless, let it finish in the background
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _post_once(self, data: bytes, methods: Sequence[str]) -> Any:
+        error = None
+        for endpoint in self.ranked():
+            try:
+                return self._post(endpoint, data, methods)
+            except Exception as exc:
+                if not never_sent(exc):
+                    raise
+                error = exc
+        raise error
+
+
+class RouterProvider(JSONBaseProvider):
+    """Web3 provider sending every request through an `RpcRouter`."""
+
+    def __init__(self, router: RpcRouter):
+        super().__init__()
+        self.router = router
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        data = self.encode_rpc_request(method, params)
+        return self.router.post(data, [method], idempotent=method not in NON_IDEMPOTENT_METHODS)
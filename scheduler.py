@@ -0,0 +1,226 @@
+import calendar
+import heapq
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+STAKE = "stake"
+UNSTAKE = "unstake"
+KINDS = (STAKE, UNSTAKE)
+# The `user_data` keys `next_run` reads, copied into the engine when a chat is scheduled
+SCHEDULE_KEYS = ("interval-type", "interval", "stake-time", "unstake-time", "day")
+
+
+class DueEvent(NamedTuple):
+    chat_id: int
+    kind: str
+    planned: datetime
+    user_data: dict
+    user_id: int
+
+
+class EventGroup(NamedTuple):
+    network: str
+    safe_address: str
+    kind: str
+
+
+def next_run(user_data: dict, kind: str, after: datetime) -> Optional[datetime]:
+    """Next time strictly after `after` at which `kind` should run for this schedule, if it runs at all."""
+    interval_type = user_data.get("interval-type")
+    if interval_type == "custom":
+        # Custom schedules repeat the stake every `interval` seconds and have no unstake
+        if kind == UNSTAKE:
+            return None
+        return after + timedelta(seconds=user_data["interval"])
+
+    at = user_data.get(f"{kind}-time")
+    if not at:
+        return None
+    hour, minute = map(int, at.split(":"))
+    if interval_type == "daily":
+        candidate = after.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= after:
+            candidate += timedelta(days=1)
+        return candidate
+    if interval_type == "monthly":
+        day = user_data.get("day", 1)
+        year, month = after.year, after.month
+        while True:
+            # Days past the end of a short month run on its last day, like `JobQueue.run_monthly`
+            last_day = calendar.monthrange(year, month)[1]
+            candidate = after.replace(year=year, month=month, day=min(day, last_day), hour=hour, minute=minute,
+                                      second=0, microsecond=0)
+            if candidate > after:
+                return candidate
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return None
+
+
+class ScheduleEngine:
+    """
+    Time-bucketed index of every chat's stake and unstake events.
+
+    A single JobQueue job calls `pop_due` once per bucket instead of one APScheduler timer per chat. Popped
+    events are rescheduled to their next occurrence before they are returned. The schedule itself is copied
+    when a chat is added, so a `/setting` in progress does not change it until the next `/start`. The next
+    run of every event is kept in the chat's `user_data["next-runs"]`, so a restart resumes from it.
+    """
+
+    def __init__(self, bucket_seconds: int):
+        self.bucket_seconds = bucket_seconds
+        self._buckets: Dict[int, Dict[Tuple[int, str], datetime]] = defaultdict(dict)
+        self._heap: List[int] = []
+        self._where: Dict[Tuple[int, str], int] = {}
+        self._chats: Dict[int, dict] = {}
+        self._users: Dict[int, int] = {}
+        self._schedules: Dict[int, dict] = {}
+
+    def __contains__(self, chat_id: int) -> bool:
+        return chat_id in self._chats
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+    def _bucket(self, when: datetime) -> int:
+        timestamp = int(when.timestamp())
+        return timestamp - timestamp % self.bucket_seconds
+
+    def _push(self, chat_id: int, kind: str, planned: datetime) -> None:
+        bucket = self._bucket(planned)
+        if bucket not in self._buckets:
+            heapq.heappush(self._heap, bucket)
+        self._buckets[bucket][(chat_id, kind)] = planned
+        self._where[(chat_id, kind)] = bucket
+        self._chats[chat_id].setdefault("next-runs", {})[kind] = planned
+
+    def _discard(self, chat_id: int, kind: str) -> None:
+        bucket = self._where.pop((chat_id, kind), None)
+        if bucket is not None:
+            # Emptied buckets stay in the heap and are skipped by `pop_due`
+            self._buckets[bucket].pop((chat_id, kind), None)
+
+    def add(self, chat_id: int, user_id: int, user_data: dict, now: datetime, resume: bool = False) -> None:
+        """
+        (Re)schedule the chat's events from `now` on. `user_data` is kept by reference and read at fire time
+        for the stake info, the schedule is copied.
+
+        With `resume`, events continue from the next runs saved in `user_data` instead of starting over, and
+        runs missed while the bot was down are skipped, not caught up.
+
+        Raises `ValueError` for an incomplete schedule or one that never moves forward, before touching the
+        chat's current schedule, which keeps running.
+        """
+        resumed = dict(user_data.get("next-runs", {})) if resume else {}
+        schedule = {key: user_data[key] for key in SCHEDULE_KEYS if key in user_data}
+        if schedule.get("interval-type") == "custom":
+            interval = schedule.get("interval") or 0
+            if interval <= 0:
+                raise ValueError("a custom schedule needs an interval of at least one second")
+            if interval < self.bucket_seconds:
+                logger.warning("Chat %s repeats every %ss, it runs at most once per %ss bucket", chat_id, interval,
+                               self.bucket_seconds)
+        plan = {}
+        for kind in KINDS:
+            try:
+                plan[kind] = next_run(schedule, kind, now)
+            except (KeyError, TypeError, ValueError) as error:
+                raise ValueError(f"the {kind} schedule is incomplete ({error!r})") from error
+            if plan[kind] is not None and kind in resumed:
+                plan[kind] = resumed[kind]
+            elif schedule.get("interval-type") == "custom" and kind == STAKE and not resume:
+                # Custom schedules start right away on `/start`, like the `run_repeating` job they replace
+                plan[kind] = now
+        self.remove(chat_id)
+        user_data.pop("next-runs", None)
+        self._chats[chat_id] = user_data
+        self._users[chat_id] = user_id
+        self._schedules[chat_id] = schedule
+        for kind, planned in plan.items():
+            if planned is not None and self._bucket(planned) < self._bucket(now):
+                logger.info("Chat %s missed its %s at %s while the bot was down", chat_id, kind, planned)
+                planned = self._following(chat_id, kind, planned, self._bucket(now) - self.bucket_seconds)
+            if planned is not None:
+                self._push(chat_id, kind, planned)
+
+    def remove(self, chat_id: int) -> bool:
+        """Forget every event of the chat. Returns whether the chat was scheduled."""
+        for kind in KINDS:
+            self._discard(chat_id, kind)
+        self._schedules.pop(chat_id, None)
+        self._users.pop(chat_id, None)
+        user_data = self._chats.pop(chat_id, None)
+        if user_data is None:
+            return False
+        user_data.pop("next-runs", None)
+        return True
+
+    def pop_due(self, now: datetime) -> List[DueEvent]:
+        """Take every event of the buckets up to `now` and schedule their next occurrence."""
+        current = self._bucket(now)
+        due = []
+        while self._heap and self._heap[0] <= current:
+            bucket = heapq.heappop(self._heap)
+            for (chat_id, kind), planned in self._buckets.pop(bucket, {}).items():
+                del self._where[(chat_id, kind)]
+                user_data = self._chats[chat_id]
+                due.append(DueEvent(chat_id, kind, planned, user_data, self._users[chat_id]))
+                try:
+                    following = self._following(chat_id, kind, planned, current)
+                except Exception:
+                    # One broken schedule must not cost the other events of the bucket their next run
+                    logger.exception("Cannot reschedule the %s of chat %s, dropping it", kind, chat_id)
+                    following = None
+                if following is not None:
+                    self._push(chat_id, kind, following)
+                else:
+                    user_data.get("next-runs", {}).pop(kind, None)
+        return due
+
+    def _following(self, chat_id: int, kind: str, planned: datetime, current: int) -> Optional[datetime]:
+        schedule = self._schedules[chat_id]
+        following = next_run(schedule, kind, planned)
+        # Occurrences that fall in an already drained bucket are coalesced into this one
+        while following is not None and self._bucket(following) <= current:
+            previous, following = following, next_run(schedule, kind, following)
+            if following is not None and following <= previous:
+                logger.error("Schedule of chat %s does not move past %s, dropping its %s", chat_id, previous, kind)
+                return None
+        return following
+
+    def peek_bucket(self, when: datetime) -> List[DueEvent]:
+        """Events of the bucket holding `when`, without taking them."""
+        return [DueEvent(chat_id, kind, planned, self._chats[chat_id], self._users[chat_id])
+                for (chat_id, kind), planned in self._buckets.get(self._bucket(when), {}).items()]
+
+    def seconds_to_next_bucket(self, now: datetime) -> float:
+        return self._bucket(now) + self.bucket_seconds - now.timestamp()
+
+
+def group_events(events: List[DueEvent]) -> Dict[EventGroup, List[DueEvent]]:
+    """Group due events so every (network, safe, kind) is sent as a single Safe transaction."""
+    groups: Dict[EventGroup, List[DueEvent]] = defaultdict(list)
+    for event in events:
+        try:
+            group = EventGroup(event.user_data["network"], event.user_data["safe-wallet"].lower(), event.kind)
+        except KeyError:
+            logger.warning("Chat %s has a schedule but no stake info, skipping %s", event.chat_id, event.kind)
+            continue
+        groups[group].append(event)
+    return groups
+
+
+def group_by_safe(groups: Dict[EventGroup, List[DueEvent]]) -> Dict[Tuple[str, str], List[EventGroup]]:
+    """
+    The groups of every (network, safe), stakes first.
+
+    Groups of one Safe take consecutive Safe nonces, so they are prepared and sent one after the other in
+    this order, which lets every group find the tx prepared for its nonce.
+    """
+    by_safe: Dict[Tuple[str, str], List[EventGroup]] = defaultdict(list)
+    for group in sorted(groups, key=lambda group: KINDS.index(group.kind)):
+        by_safe[(group.network, group.safe_address)].append(group)
+    return by_safe
@@ -0,0 +1,354 @@
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import wait
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from eth_account import Account
+from gnosis.safe import Safe, SafeTx
+from gnosis.safe.exceptions import InvalidInternalTx
+from gnosis.safe.multi_send import MultiSendOperation, MultiSendTx
+from hexbytes import HexBytes
+import requests
+
+import staking_calls
+from clients import ChainClient, get_client
+from config import OPERATION_CALL, OPERATION_DELEGATE_CALL, PREPARE_LEAD_SECONDS, SCHEDULE_BUCKET_SECONDS, private_key
+from metrics import phase
+from nonces import nonce_manager, safe_nonce_key, sender_nonce_key
+from rpc_batch import RpcError, decode_result
+from rpc_router import never_sent
+
+logger = logging.getLogger(__name__)
+
+# Same padding `Safe.estimate_tx_gas` puts on top of the raw `requiredTxGas` / `eth_estimateGas` numbers
+PROXY_GAS = 1000
+OLD_CALL_GAS = 35000
+WEB3_ESTIMATION_OFFSET = 23000
+
+# Prepared txs not used by then belong to a dispatch that already happened without them
+PREPARED_TX_MAX_AGE = PREPARE_LEAD_SECONDS + SCHEDULE_BUCKET_SECONDS
+
+# (validator, amount in wei) pairs
+Delegations = List[Tuple[str, int]]
+
+
+class SafeCall(NamedTuple):
+    to: str
+    value: int
+    data: HexBytes
+    operation: int
+
+
+@lru_cache(maxsize=1)
+def get_executor_address() -> str:
+    return Account.from_key(private_key).address
+
+
+def _parse_required_tx_gas(data: Optional[str]) -> Optional[int]:
+    """`requiredTxGas` returns its estimation as revert data, the gas is in the last 32 bytes."""
+    if not data or "0x" not in data:
+        return None
+    gas = HexBytes(data[data.find("0x"):])[4 + 32 + 32:]
+    if len(gas) != 32:
+        return None
+    return int.from_bytes(gas, "big")
+
+
+def get_delegations(job_data: dict) -> Delegations:
+    """Validators and amounts saved by the stake-info conversation, including the older single validator keys."""
+    if "validators" in job_data:
+        validators, amounts = job_data["validators"], job_data.get("staking-amounts", [])
+        if len(validators) != len(amounts):
+            raise ValueError(f"{len(validators)} validators saved with {len(amounts)} staking amounts, "
+                             f"run /set_stake_info again")
+        return list(zip(validators, amounts))
+    return [(job_data["validator"], job_data["staking-amount"])]
+
+
+def merge_delegations(*delegations: Delegations) -> Delegations:
+    """Sum the amounts of schedules that share a Safe, keeping the first-seen validator order."""
+    merged = {}
+    for validator, amount in itertools.chain(*delegations):
+        merged[validator] = merged.get(validator, 0) + amount
+    return list(merged.items())
+
+
+def _multisend(client: ChainClient, txs: List[MultiSendTx]) -> SafeCall:
+    data = staking_calls.MULTI_SEND.encode(b"".join(tx.encoded_data for tx in txs))
+    return SafeCall(client.multisend_address, 0, HexBytes(data), OPERATION_DELEGATE_CALL)
+
+
+def build_stake_call(client: ChainClient, delegations: Delegations) -> SafeCall:
+    """`delegate` to one validator, or one `delegate` per validator bundled through MultiSend."""
+    if len(delegations) == 1:
+        validator, amount = delegations[0]
+        data = staking_calls.DELEGATE.encode(validator)
+        return SafeCall(client.staking_address, amount, HexBytes(data), OPERATION_CALL)
+    return _multisend(client, [
+        MultiSendTx(MultiSendOperation.CALL, client.staking_address, amount, staking_calls.DELEGATE.encode(validator))
+        for validator, amount in delegations
+    ])
+
+
+def build_unstake_call(client: ChainClient, delegations: Delegations) -> SafeCall:
+    """`undelegate` from one validator, or a single `bulkUndelegate` for several."""
+    if len(delegations) == 1:
+        data = staking_calls.UNDELEGATE.encode(*delegations[0])
+    else:
+        validators, amounts = zip(*delegations)
+        data = staking_calls.BULK_UNDELEGATE.encode(list(validators), list(amounts))
+    return SafeCall(client.staking_address, 0, HexBytes(data), OPERATION_CALL)
+
+
+def execute_staking(network: str, safe_address: str, delegations: Delegations) -> HexBytes:
+    """Delegate to every validator in one Safe transaction. Blocking, so run it through `executor`."""
+    return execute_safe_call(network, safe_address, build_stake_call(get_client(network), delegations))
+
+
+def execute_unstaking(network: str, safe_address: str, delegations: Delegations) -> HexBytes:
+    """Undelegate from every validator in one Safe transaction. Blocking, so run it through `executor`."""
+    return execute_safe_call(network, safe_address, build_unstake_call(get_client(network), delegations))
+
+
+def prepare_staking(network: str, safe_address: str, delegations: Delegations) -> None:
+    prepare_safe_call(network, safe_address, build_stake_call(get_client(network), delegations))
+
+
+def prepare_unstaking(network: str, safe_address: str, delegations: Delegations) -> None:
+    prepare_safe_call(network, safe_address, build_unstake_call(get_client(network), delegations))
+
+
+class BuildInputs(NamedTuple):
+    chain_safe_nonce: int
+    version: str
+    threshold: int
+    balance: int
+    safe_tx_gas: int
+    gas_price: int
+    sender_nonce: int
+
+
+class PreparedTx(NamedTuple):
+    call: SafeCall
+    safe_tx: SafeTx
+    tx_gas: int
+    # Safe state the tx was built and simulated against
+    threshold: int
+    balance: int
+    prepared_at: float
+
+
+# Signed txs built ahead of their scheduled time, by (network, safe address) and then (Safe nonce, call)
+_prepared: Dict[Tuple[str, str], Dict[Tuple[int, SafeCall], PreparedTx]] = {}
+_prepared_lock = threading.Lock()
+
+
+def _fetch_build_inputs(client: ChainClient, safe: Safe, call: SafeCall) -> BuildInputs:
+    """Every read the Safe tx depends on, in one batch shared with the other jobs of this tick."""
+    safe_contract = client.safe_contract
+    required_tx_gas = safe_contract.encodeABI(fn_name="requiredTxGas",
+                                              args=[call.to, call.value, call.data, call.operation])
+    with phase(client.network, "safe_info"):
+        futures = client.batcher.call_many([
+            ("eth_call", [{"to": safe.address, "data": safe_contract.encodeABI(fn_name="nonce")}, "latest"]),
+            ("eth_call", [{"to": safe.address, "data": safe_contract.encodeABI(fn_name="VERSION")}, "latest"]),
+            ("eth_call", [{"to": safe.address, "data": safe_contract.encodeABI(fn_name="getThreshold")}, "latest"]),
+            ("eth_getBalance", [safe.address, "latest"]),
+            ("eth_call", [{"from": safe.address, "to": safe.address, "data": required_tx_gas}, "latest"]),
+            ("eth_estimateGas", [{"from": safe.address, "to": call.to, "value": hex(call.value),
+                                  "data": call.data.hex()}]),
+            ("eth_gasPrice", []),
+            ("eth_getTransactionCount", [get_executor_address(), "pending"]),
+        ])
+        wait(futures)
+    safe_nonce, version, threshold, balance, required_gas, web3_gas, gas_price, sender_nonce = futures
+
+    try:
+        # `requiredTxGas` always reverts, Ganache-like nodes put the revert data in `result` instead
+        gas = _parse_required_tx_gas(required_gas.result())
+    except RpcError as error:
+        gas = _parse_required_tx_gas(error.data)
+    if gas is not None:
+        gas += PROXY_GAS + OLD_CALL_GAS
+    else:
+        gas = int(web3_gas.result(), 16) + PROXY_GAS + OLD_CALL_GAS + WEB3_ESTIMATION_OFFSET
+
+    return BuildInputs(
+        chain_safe_nonce=decode_result(["uint256"], safe_nonce),
+        version=decode_result(["string"], version),
+        threshold=decode_result(["uint256"], threshold),
+        balance=int(balance.result(), 16),
+        safe_tx_gas=gas,
+        gas_price=int(gas_price.result(), 16),
+        sender_nonce=int(sender_nonce.result(), 16),
+    )
+
+
+def _build_signed_tx(client: ChainClient, safe: Safe, call: SafeCall, inputs: BuildInputs,
+                     safe_nonce: int) -> PreparedTx:
+    """Build and sign the Safe tx for `safe_nonce`, simulating it when the chain is already at that nonce."""
+    with phase(client.network, "signing"):
+        safe_tx = safe.build_multisig_tx(to=call.to, value=call.value, data=call.data, operation=call.operation,
+                                         safe_tx_gas=inputs.safe_tx_gas, safe_nonce=safe_nonce,
+                                         safe_version=inputs.version)
+        # owner 1 sign
+        safe_tx.sign(private_key)
+
+    if safe_nonce == inputs.chain_safe_nonce:
+        # Simulate `execTransaction` and estimate the outer tx gas in the same round-trip
+        exec_data = client.safe_contract.encodeABI(fn_name="execTransaction", args=[
+            safe_tx.to, safe_tx.value, safe_tx.data, safe_tx.operation, safe_tx.safe_tx_gas, safe_tx.base_gas,
+            safe_tx.gas_price, safe_tx.gas_token, safe_tx.refund_receiver, safe_tx.signatures,
+        ])
+        exec_call = {"from": get_executor_address(), "to": safe.address, "data": exec_data}
+        with phase(client.network, "simulation"):
+            futures = client.batcher.call_many([
+                ("eth_call", [exec_call, "latest"]),
+                ("eth_estimateGas", [exec_call]),
+            ])
+            wait(futures)
+        simulation, tx_gas = futures
+        if not decode_result(["bool"], simulation):
+            raise InvalidInternalTx(f"Simulation of safe tx {safe_tx.safe_tx_hash.hex()} returned false")
+        tx_gas = max(int(tx_gas.result(), 16) + 75000, safe_tx.recommended_gas())
+    else:
+        # Earlier txs of this Safe are still pending, the node can only check this one once they are mined
+        tx_gas = safe_tx.recommended_gas()
+    return PreparedTx(call, safe_tx, tx_gas, inputs.threshold, inputs.balance, time.monotonic())
+
+
+def _send(client: ChainClient, prepared: PreparedTx, tx_nonce: int, gas_price: int) -> HexBytes:
+    # Every parameter is already known, chain id included, so building the tx asks the node nothing
+    with phase(client.network, "broadcast"):
+        tx = prepared.safe_tx.w3_tx.build_transaction({
+            "from": get_executor_address(),
+            "chainId": client.chain_id,
+            "gas": prepared.tx_gas,
+            "gasPrice": gas_price,
+            "nonce": tx_nonce,
+        })
+        signed_tx = Account.sign_transaction(tx, private_key)
+        try:
+            tx_hash = client.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+        except requests.RequestException as error:
+            if never_sent(error):
+                # The callers give both nonces back, no node saw the tx
+                raise
+            # The node may have accepted the tx, so its nonces must not be reused. The Safe nonce stays
+            # reserved like for a sent tx, the receipt tracker resyncs it if the tx turns out to be dropped.
+            logger.warning("Broadcast of Safe %s tx with nonce %s failed after sending (%s), tracking it",
+                           prepared.safe_tx.safe_address, prepared.safe_tx.safe_nonce, type(error).__name__)
+            nonce_manager.resync(sender_nonce_key(client.network, get_executor_address()))
+            tx_hash = HexBytes(signed_tx.hash)
+    logger.info("Safe %s sent tx %s with nonce %s", prepared.safe_tx.safe_address, tx_hash.hex(),
+                prepared.safe_tx.safe_nonce)
+    return tx_hash
+
+
+def prepare_safe_call(network: str, safe_address: str, call: SafeCall) -> None:
+    """Build, estimate, sign and simulate `call` ahead of time, so firing it only needs a check and a broadcast."""
+    with phase(network, "client"):
+        client = get_client(network)
+        safe = client.get_safe(safe_address)
+    inputs = _fetch_build_inputs(client, safe, call)
+    safe_nonce = nonce_manager.peek(safe_nonce_key(network, safe.address), inputs.chain_safe_nonce)
+    with _prepared_lock:
+        # Other calls of this Safe prepared for the same bucket are sent first, this one follows them
+        taken = {nonce for nonce, other in _live_prepared(network, safe.address) if other != call}
+    while safe_nonce in taken:
+        safe_nonce += 1
+    prepared = _build_signed_tx(client, safe, call, inputs, safe_nonce)
+    with _prepared_lock:
+        by_key = _prepared.setdefault((network, safe.address), {})
+        for key in [key for key in by_key if key[1] == call]:
+            del by_key[key]
+        by_key[(safe_nonce, call)] = prepared
+    logger.info("Safe %s prepared tx with nonce %s", safe.address, safe_nonce)
+
+
+def _live_prepared(network: str, safe_address: str) -> Dict[Tuple[int, SafeCall], PreparedTx]:
+    """The Safe's prepared txs, dropping the expired ones. Call it with `_prepared_lock` held."""
+    by_key = _prepared.get((network, safe_address), {})
+    for key, prepared in list(by_key.items()):
+        if time.monotonic() - prepared.prepared_at > PREPARED_TX_MAX_AGE:
+            del by_key[key]
+    return by_key
+
+
+def _has_prepared(network: str, safe_address: str, call: SafeCall) -> bool:
+    with _prepared_lock:
+        return any(other == call for _, other in _live_prepared(network, safe_address))
+
+
+def _take_prepared(network: str, safe_address: str, call: SafeCall, safe_nonce: int) -> Optional[PreparedTx]:
+    """Pop every tx prepared for `call` and return the one signed for `safe_nonce`, if any."""
+    with _prepared_lock:
+        by_key = _live_prepared(network, safe_address)
+        taken = {nonce: by_key.pop((nonce, other)) for nonce, other in list(by_key) if other == call}
+    return taken.get(safe_nonce)
+
+
+def _send_prepared(client: ChainClient, safe: Safe, call: SafeCall) -> Optional[HexBytes]:
+    """Broadcast the tx prepared for `call` if the Safe did not change since, `None` when it has to be rebuilt."""
+    safe_contract = client.safe_contract
+    with phase(client.network, "check"):
+        futures = client.batcher.call_many([
+            ("eth_call", [{"to": safe.address, "data": safe_contract.encodeABI(fn_name="nonce")}, "latest"]),
+            ("eth_call", [{"to": safe.address, "data": safe_contract.encodeABI(fn_name="getThreshold")}, "latest"]),
+            ("eth_getBalance", [safe.address, "latest"]),
+            ("eth_gasPrice", []),
+            ("eth_getTransactionCount", [get_executor_address(), "pending"]),
+        ])
+        wait(futures)
+    safe_nonce, threshold, balance, gas_price, sender_nonce = futures
+    safe_key = safe_nonce_key(client.network, safe.address)
+    sender_key = sender_nonce_key(client.network, get_executor_address())
+    safe_nonce, tx_nonce = nonce_manager.reserve({
+        safe_key: decode_result(["uint256"], safe_nonce),
+        sender_key: int(sender_nonce.result(), 16),
+    })
+    prepared = _take_prepared(client.network, safe.address, call, safe_nonce)
+    if (prepared is None or decode_result(["uint256"], threshold) != prepared.threshold
+            or int(balance.result(), 16) != prepared.balance):
+        logger.info("Safe %s changed since its tx was prepared, rebuilding it", safe.address)
+        nonce_manager.release(safe_key, safe_nonce)
+        nonce_manager.release(sender_key, tx_nonce)
+        return None
+    try:
+        return _send(client, prepared, tx_nonce, int(gas_price.result(), 16))
+    except Exception:
+        nonce_manager.release(safe_key, safe_nonce)
+        nonce_manager.release(sender_key, tx_nonce)
+        raise
+
+
+def execute_safe_call(network: str, safe_address: str, call: SafeCall) -> HexBytes:
+    """Send `call` as a Safe transaction, reusing the tx prepared for it when the Safe did not change since."""
+    with phase(network, "client"):
+        client = get_client(network)
+        safe = client.get_safe(safe_address)
+
+    if _has_prepared(network, safe.address, call):
+        tx_hash = _send_prepared(client, safe, call)
+        if tx_hash is not None:
+            return tx_hash
+
+    inputs = _fetch_build_inputs(client, safe, call)
+    safe_key = safe_nonce_key(network, safe.address)
+    sender_key = sender_nonce_key(network, get_executor_address())
+    safe_nonce, tx_nonce = nonce_manager.reserve({
+        safe_key: inputs.chain_safe_nonce,
+        sender_key: inputs.sender_nonce,
+    })
+    logger.info("Safe %s nonce=%s (chain %s) threshold=%s version=%s safe_tx_gas=%s sender nonce=%s", safe.address,
+                safe_nonce, inputs.chain_safe_nonce, inputs.threshold, inputs.version, inputs.safe_tx_gas, tx_nonce)
+    try:
+        prepared = _build_signed_tx(client, safe, call, inputs, safe_nonce)
+        return _send(client, prepared, tx_nonce, inputs.gas_price)
+    except Exception:
+        nonce_manager.release(safe_key, safe_nonce)
+        nonce_manager.release(sender_key, tx_nonce)
+        raise
@@ -0,0 +1,30 @@
+from typing import Any, Tuple
+
+from eth_abi import encode
+from eth_utils import function_signature_to_4byte_selector
+
+
+class ContractFunction:
+    """Calldata encoder for one contract function, with its selector computed once at import."""
+
+    def __init__(self, name: str, arg_types: Tuple[str, ...]):
+        self.signature = f"{name}({','.join(arg_types)})"
+        self.selector = function_signature_to_4byte_selector(self.signature)
+        self.arg_types = arg_types
+
+    def encode(self, *args: Any) -> bytes:
+        return self.selector + encode(self.arg_types, args)
+
+
+# Staking contract, signatures as in its ABI
+DELEGATE = ContractFunction("delegate", ("address",))
+UNDELEGATE = ContractFunction("undelegate", ("address", "uint256"))
+BULK_UNDELEGATE = ContractFunction("bulkUndelegate", ("address[]", "uint256[]"))
+CLAIM_REWARDS = ContractFunction("claimRewards", ("address[]",))
+GET_MANY_STAKING_AMOUNTS = ContractFunction("getManyStakingAmounts", ("address[]", "address[]"))
+GET_MANY_STAKING_TOTALS = ContractFunction("getManyStakingTotals", ("address[]",))
+GET_REWARDS = ContractFunction("getRewards", ("address", "address[]"))
+
+# MultiSendCallOnly
+MULTI_SEND = ContractFunction("multiSend", ("bytes",))
+
@@ -0,0 +1,103 @@
+import threading
+from typing import List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from cachetools import TTLCache
+
+
+class ValidatorStatus(NamedTuple):
+    validator: str
+    # All amounts in wei
+    staked: int
+    reward: int
+    pool_total: int
+
+
+class StakingStatus(NamedTuple):
+    block_number: int
+    validators: List[ValidatorStatus]
+
+
+def fetch_status(network: str, safe_address: str, validators: Sequence[str],
+                 block_number: Optional[int] = None) -> StakingStatus:
+    """
+    Read the Safe's stake and pending rewards and the pool totals of every validator in one batch. Blocking.
+
+    Without a known `block_number` the latest block is read in the same batch as the views.
+    """
+    # The chain stack is imported on first use, so the bot does not wait for it to start polling
+    import staking_calls
+    from clients import get_client
+    from rpc_batch import decode_result
+    from web3 import Web3
+
+    client = get_client(network)
+    safe_address = Web3.to_checksum_address(safe_address)
+    validators = list(validators)
+    block_tag = hex(block_number) if block_number is not None else "latest"
+    views = [
+        staking_calls.GET_MANY_STAKING_AMOUNTS.encode(validators, [safe_address] * len(validators)),
+        staking_calls.GET_REWARDS.encode(safe_address, validators),
+        staking_calls.GET_MANY_STAKING_TOTALS.encode(validators),
+    ]
+    calls = [("eth_call", [{"to": client.staking_address, "data": "0x" + data.hex()}, block_tag]) for data in views]
+    if block_number is None:
+        calls.append(("eth_blockNumber", []))
+    futures = client.batcher.call_many(calls)
+    if block_number is None:
+        block_number = int(futures[3].result(), 16)
+    staked, rewards, totals = (decode_result(["uint256[]"], future) for future in futures[:3])
+    return StakingStatus(block_number, [ValidatorStatus(*row) for row in zip(validators, staked, rewards, totals)])
+
+
+def fetch_block_number(network: str) -> int:
+    """Latest block number of `network`. Blocking."""
+    from clients import get_client
+
+    return int(get_client(network).batcher.call_many([("eth_blockNumber", [])])[0].result(), 16)
+
+
+StatusKey = Tuple[str, int, str, Tuple[str, ...]]
+
+
+class StatusCache:
+    """
+    Staking status by (network, block number, safe, validators), so /status calls in one block share a read.
+
+    Every entry expires after `ttl` seconds, and so does the head block known for each network. When the head
+    moves on, `set_head` drops the entries of older blocks right away, so with a job feeding it every new
+    block nothing older than the previous block is ever served.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 4096):
+        self._lock = threading.Lock()
+        self._heads: TTLCache = TTLCache(maxsize=16, ttl=ttl)
+        self._entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._networks: Set[str] = set()
+
+    def networks(self) -> Set[str]:
+        """Every network a status was ever read on."""
+        with self._lock:
+            return set(self._networks)
+
+    def head(self, network: str) -> Optional[int]:
+        with self._lock:
+            return self._heads.get(network)
+
+    def set_head(self, network: str, block_number: int) -> None:
+        with self._lock:
+            if block_number > self._heads.get(network, -1):
+                stale = [key for key in self._entries if key[0] == network and key[1] < block_number]
+                for key in stale:
+                    self._entries.pop(key, None)
+            self._heads[network] = max(block_number, self._heads.get(network, -1))
+
+    def get(self, network: str, block_number: int, safe_address: str,
+            validators: Sequence[str]) -> Optional[StakingStatus]:
+        with self._lock:
+            return self._entries.get((network, block_number, safe_address.lower(), tuple(validators)))
+
+    def put(self, network: str, safe_address: str, validators: Sequence[str], status: StakingStatus) -> None:
+        self.set_head(network, status.block_number)
+        with self._lock:
+            self._networks.add(network)
+            self._entries[(network, status.block_number, safe_address.lower(), tuple(validators))] = status